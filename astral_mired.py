@@ -1,6 +1,8 @@
 import datetime
-from typing import Tuple, List
+from bisect import bisect_right
+from typing import Tuple, List, Dict, Sequence
 
+import numpy as np
 from astral import Observer
 from astral.sun import sun
 
@@ -10,6 +12,16 @@ def get_decimal_time(dt: datetime.datetime) -> float:
     return dt.hour + dt.minute / 60 + dt.second / 3600
 
 
+def get_local_datetime(date: datetime.date, hours_decimal: float) -> datetime.datetime:
+    """
+    Returns the aware local datetime at the given decimal wall-clock time of the
+    date. Values outside [0, 24) spill over into the neighbouring days. DST
+    transitions are taken into account.
+    """
+    midnight = datetime.datetime.combine(date, datetime.time())
+    return (midnight + datetime.timedelta(hours=hours_decimal)).astimezone()
+
+
 class EasyAstral:
     def __init__(self, location: Tuple[float, float, float]):
         self._location = location
@@ -24,7 +36,7 @@ class EasyAstral:
         assert info is not None
         return info
 
-    def _get_sun_time(self, event: str) -> float:
+    def _update(self) -> None:
         new_day = datetime.datetime.now().day
 
         if new_day != self._day:
@@ -34,8 +46,33 @@ class EasyAstral:
                 tzinfo=self._get_tzinfo(),
             )
 
+    def _get_sun_time(self, event: str) -> float:
+        self._update()
         return get_decimal_time(self._sun[event])
 
+    def get_day(self) -> int:
+        """
+        Returns the day of the month that the sun times are currently calculated
+        for. Rolls over to the new day first if necessary.
+        """
+        self._update()
+        return self._day
+
+    def get_sun_times_for_date(self, date: datetime.date) -> Dict[str, float]:
+        """
+        Returns the decimal times of all sun events on an arbitrary date, using the
+        local UTC offset that is in effect on that date.
+        """
+        info = datetime.datetime.combine(date, datetime.time(12)).astimezone().tzinfo
+        assert info is not None
+
+        return {
+            event: get_decimal_time(time)
+            for event, time in sun(
+                Observer(*self._location), date=date, tzinfo=info
+            ).items()
+        }
+
     @staticmethod
     def get_now_decimal() -> float:
         now = datetime.datetime.now()
@@ -91,18 +128,70 @@ class MiredCalculator:
         self._values = values
         self._astral = EasyAstral(lat_long_height)
 
+        # The schedule resolved for the current astral day. Contains the
+        # breakpoints of the day along with their copies shifted by -24 and
+        # +24 hours, so that the interpolation wraps around midnight.
+        self._times: List[float] = []
+        self._mireds: List[float] = []
+        self._times_array = np.empty(0)
+        self._mireds_array = np.empty(0)
+        self._compiled_for_day: int | None = None
+
+    def set_values(
+        self, values: List[Tuple[float, float] | Tuple[TimeOfDayEvent, float]]
+    ) -> None:
+        self._values = values
+        self._compiled_for_day = None
+
     def _get_time_and_value(
-        self, item: Tuple[float, float] | Tuple[TimeOfDayEvent, float]
+        self,
+        item: Tuple[float, float] | Tuple[TimeOfDayEvent, float],
+        sun_times: Dict[str, float] | None = None,
     ) -> Tuple[float, float]:
         time, value = item
 
         if isinstance(time, TimeOfDayEvent):
-            time = self._astral._get_sun_time(time._name) + time._offset
+            sun_time = (
+                sun_times[time._name]
+                if sun_times is not None
+                else self._astral._get_sun_time(time._name)
+            )
+            time = sun_time + time._offset
 
         assert isinstance(time, (float, int))
 
         return time, value
 
+    def _compile_table(
+        self, for_date: datetime.date | None = None
+    ) -> Tuple[List[float], List[float]]:
+        sun_times = (
+            self._astral.get_sun_times_for_date(for_date)
+            if for_date is not None
+            else None
+        )
+        d = [self._get_time_and_value(item, sun_times) for item in self._values]
+
+        for i in range(len(d) - 1):
+            assert (
+                d[i][0] < d[i + 1][0]
+            ), f"Times passed to MiredCalculator must be in ascending order."
+
+        times = [time + shift for shift in (-24, 0, 24) for time, _ in d]
+        mireds = [value for _ in range(3) for _, value in d]
+
+        return times, mireds
+
+    def _compile(self) -> None:
+        self._times, self._mireds = self._compile_table()
+        self._times_array = np.array(self._times, dtype=float)
+        self._mireds_array = np.array(self._mireds, dtype=float)
+        self._compiled_for_day = self._astral._day
+
+    def _compile_if_necessary(self) -> None:
+        if self._compiled_for_day != self._astral.get_day():
+            self._compile()
+
     def get_current_mired(self, for_time_hr_decimal: float | None = None):
         """
         :param for_time_hr_decimal: For testing purposes. If None, uses current time.
@@ -116,46 +205,102 @@ class MiredCalculator:
             else EasyAstral.get_now_decimal()
         )
 
-        d = [self._get_time_and_value(item) for item in self._values]
+        self._compile_if_necessary()
 
-        for i in range(len(d) - 1):
-            assert (
-                d[i][0] < d[i + 1][0]
-            ), f"Times passed to MiredCalculator must be in ascending order."
+        times = self._times
+        mireds = self._mireds
+
+        assert times, "MiredCalculator needs at least one value."
 
-        new_d: list[Tuple[float, float]] = []
+        # Index of the first breakpoint strictly after now
+        i = bisect_right(times, now)
 
-        for time, value in d:
-            new_d.append((time - 24, value))
+        if i == 0:
+            return mireds[0]
 
-        for time, value in d:
-            new_d.append((time, value))
+        if i == len(times):
+            return mireds[-1]
 
-        for time, value in d:
-            new_d.append((time + 24, value))
+        a, v1 = times[i - 1], mireds[i - 1]
+        b, v2 = times[i], mireds[i]
 
-        d = new_d
+        return v1 + (v2 - v1) * (now - a) / (b - a)
+
+    def get_time_of_next_crossing(
+        self, low: float, high: float, for_time_hr_decimal: float | None = None
+    ) -> float | None:
+        """
+        Returns the earliest time at which the schedule leaves the [low, high]
+        range, in decimal hours relative to the start of the current day. The
+        result can be larger than 24 if it happens after midnight.
 
-        prev = None
-        next = None
+        Returns None if the schedule stays within the range for the rest of the
+        compiled table.
 
-        for i, (time, value) in enumerate(d):
-            if time > now:
-                next = (time, value)
-                break
+        :param for_time_hr_decimal: The time to start the search from. If None,
+                                    uses the current time.
+        """
 
-            prev = (time, value)
+        now = (
+            for_time_hr_decimal
+            if for_time_hr_decimal is not None
+            else EasyAstral.get_now_decimal()
+        )
 
-        if prev is None and next is not None:
-            return next[1]
+        t0 = now
+        m0 = self.get_current_mired(now)
+        times = self._times
+        mireds = self._mireds
 
-        if next is None and prev is not None:
-            return prev[1]
+        for i in range(bisect_right(times, now), len(times)):
+            t1, m1 = times[i], mireds[i]
 
-        assert prev is not None
-        assert next is not None
+            # The schedule is linear between breakpoints, so if a segment leaves
+            # the range, it crosses the boundary exactly once.
+            if m1 < low or m1 > high:
+                target = low if m1 < low else high
+                return t0 + (t1 - t0) * (target - m0) / (m1 - m0)
 
-        a, v1 = prev
-        b, v2 = next
+            t0, m0 = t1, m1
 
-        return v1 + (v2 - v1) * (now - a) / (b - a)
+        return None
+
+    def get_mireds(
+        self,
+        hours_decimal: Sequence[float] | np.ndarray,
+        for_date: datetime.date | None = None,
+    ) -> np.ndarray:
+        """
+        Batch variant of :meth:`get_current_mired`. Evaluates the schedule at all
+        of the provided times with a single NumPy call.
+
+        :param hours_decimal: Times of day in decimal hours i.e. 12.5 for 12:30.
+        :param for_date: The day whose sun times should be used. If None, the
+                         schedule of the current day is used.
+        """
+
+        if for_date is None:
+            self._compile_if_necessary()
+            times, mireds = self._times_array, self._mireds_array
+        else:
+            table = self._compile_table(for_date)
+            times = np.array(table[0], dtype=float)
+            mireds = np.array(table[1], dtype=float)
+
+        assert times.size, "MiredCalculator needs at least one value."
+
+        return np.interp(np.asarray(hours_decimal, dtype=float), times, mireds)
+
+    def get_mireds_for_range(
+        self,
+        start: float = 0.0,
+        stop: float = 24.0,
+        step: float = 1 / 60,
+        for_date: datetime.date | None = None,
+    ) -> np.ndarray:
+        """
+        Evaluates the schedule at evenly spaced times in the [start, stop) range,
+        one minute apart by default. See :meth:`get_mireds`.
+        """
+
+        return self.get_mireds(np.arange(start, stop, step), for_date)
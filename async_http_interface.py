@@ -0,0 +1,404 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import urllib.parse
+from http import HTTPStatus
+from typing import Any, Dict, Tuple
+
+from pyziggy.message_loop import message_loop
+
+import metrics
+
+from http_interface import (
+    control_page,
+    device_state,
+    http_message_handler,
+    loop_monitor,
+    parse_batch_payload,
+    post_batch,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _BadRequest(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class _Request:
+    def __init__(
+        self,
+        method: str,
+        target: str,
+        version: str,
+        headers: Dict[str, str],
+        body: bytes,
+    ):
+        url = urllib.parse.urlsplit(target)
+        self.method = method
+        self.path = urllib.parse.unquote(url.path)
+        self.query = dict(urllib.parse.parse_qsl(url.query))
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+
+        return connection != "close"
+
+    def get_json(self) -> Any:
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            raise _BadRequest("Invalid JSON")
+
+
+_Response = Tuple[int, Dict[str, str], bytes]
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _json_response(status: int, payload: Any) -> _Response:
+    return status, _JSON_HEADERS, json.dumps(payload).encode("utf-8")
+
+
+class AsyncHttpServer:
+    """
+    An asyncio based alternative to the Flask app in :mod:`http_interface`, serving
+    the same routes. It runs its own event loop on a background thread, so idle and
+    slow clients only cost a coroutine instead of a worker thread.
+
+    Connections are kept alive between requests. At most ``max_connections`` are
+    accepted at a time, and at most ``max_concurrent_requests`` requests are handled
+    at the same time, further requests wait for their turn.
+
+    Commands reach the automation code only through ``message_loop.post_message``.
+
+    Request bodies need a Content-Length. Requests with a Transfer-Encoding are
+    answered with 501 Not Implemented, and the connection is closed.
+    """
+
+    MAX_HEADER_SIZE = 16 * 1024
+    MAX_BODY_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 5001,
+        max_connections: int = 1024,
+        max_concurrent_requests: int = 64,
+        keep_alive_timeout: float = 15.0,
+    ):
+        self._host = host
+        self._port = port
+        self._max_connections = max_connections
+        self._max_concurrent_requests = max_concurrent_requests
+        self._keep_alive_timeout = keep_alive_timeout
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.Server | None = None
+        self._thread: threading.Thread | None = None
+        self._started = threading.Event()
+        self._start_error: Exception | None = None
+        self._connections = 0
+
+    def get_port(self) -> int:
+        """
+        :return: The port the server listens on. Useful if it was created with
+                 port 0.
+        """
+        if self._server is not None:
+            return self._server.sockets[0].getsockname()[1]
+
+        return self._port
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="async_http_interface", daemon=True
+        )
+        self._thread.start()
+        self._started.wait()
+
+        # E.g. the port is already in use
+        if self._start_error is not None:
+            raise self._start_error
+
+        print(f"Launching asyncio HTTP server on port {self.get_port()}")
+
+    def stop(self) -> None:
+        if self._loop is None or self._thread is None or self._start_error:
+            return
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(2)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self._max_concurrent_requests)
+
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(
+                    self._handle_connection,
+                    self._host,
+                    self._port,
+                    limit=AsyncHttpServer.MAX_HEADER_SIZE,
+                    backlog=1024,
+                )
+            )
+        except Exception as e:
+            self._start_error = e
+            self._loop.close()
+            return
+        finally:
+            self._started.set()
+
+        self._loop.run_forever()
+        self._server.close()
+
+        # State streams only end when the client disconnects
+        tasks = asyncio.all_tasks(self._loop)
+
+        for task in tasks:
+            task.cancel()
+
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        if self._connections >= self._max_connections:
+            writer.close()
+            return
+
+        self._connections += 1
+
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        self._read_request(reader), self._keep_alive_timeout
+                    )
+                except _BadRequest as e:
+                    await self._write_response(
+                        writer, _json_response(e.status, {"error": str(e)}), False
+                    )
+                    return
+
+                if request is None:
+                    return
+
+                if request.path == "/pyziggy/state/stream" and request.method == "GET":
+                    await self._stream_device_state(request, writer)
+                    return
+
+                async with self._semaphore:
+                    try:
+                        response = await self._dispatch(request)
+                    except _BadRequest as e:
+                        response = _json_response(e.status, {"error": str(e)})
+                    except Exception:
+                        logger.exception("Failed to handle HTTP request")
+                        response = _json_response(500, {"error": "Internal error"})
+
+                keep_alive = request.keep_alive()
+                await self._write_response(writer, response, keep_alive)
+
+                if not keep_alive:
+                    return
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> _Request | None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            raise _BadRequest("Header too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+
+        try:
+            method, path, version = lines[0].split(" ")
+        except ValueError:
+            raise _BadRequest("Malformed request line")
+
+        headers: Dict[str, str] = {}
+
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+
+        # The body of a chunked request can't be read using Content-Length, and
+        # whatever follows it would be taken for the next request. The connection
+        # is closed after the error response, so nothing of the body is parsed.
+        if "transfer-encoding" in headers:
+            raise _BadRequest("Transfer-Encoding is not supported", 501)
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise _BadRequest("Invalid Content-Length")
+
+        if length < 0 or length > AsyncHttpServer.MAX_BODY_SIZE:
+            raise _BadRequest("Invalid Content-Length")
+
+        body = await reader.readexactly(length) if length else b""
+
+        return _Request(method, path, version, headers, body)
+
+    async def _dispatch(self, request: _Request) -> _Response:
+        if request.path == "/pyziggy" and request.method == "GET":
+            accepts_gzip = "gzip" in request.headers.get("accept-encoding", "")
+            if_none_match = request.headers.get("if-none-match", "")
+
+            return control_page.get_response(
+                accepts_gzip, lambda etag: f'"{etag}"' in if_none_match
+            )
+
+        if request.path == "/pyziggy/state" and request.method == "GET":
+            return 200, _JSON_HEADERS, device_state.get_state_json()
+
+        if request.path.startswith("/pyziggy/state/") and request.method == "GET":
+            device = request.path[len("/pyziggy/state/") :]
+            state = device_state.get_device_json(device)
+
+            if state is None:
+                return _json_response(404, {"error": f"No device called {device}"})
+
+            return 200, _JSON_HEADERS, state
+
+        if request.path == "/pyziggy/loop" and request.method == "GET":
+            if not loop_monitor.is_installed():
+                return _json_response(
+                    404, {"error": "The loop monitor isn't installed, see config.toml"}
+                )
+
+            return _json_response(200, loop_monitor.get_stats())
+
+        if request.path == "/metrics" and request.method == "GET":
+            if not metrics.enabled:
+                return 404, {}, b"Metrics are disabled in config.toml\n"
+
+            return (
+                200,
+                {"Content-Type": metrics.CONTENT_TYPE},
+                metrics.render_prometheus().encode("utf-8"),
+            )
+
+        if request.path == "/pyziggy/post" and request.method == "POST":
+            payload = request.get_json()
+            message_loop.post_message(lambda: http_message_handler(payload))
+            return 200, {}, b""
+
+        if request.path == "/pyziggy/batch" and request.method == "POST":
+            try:
+                actions, timeout = parse_batch_payload(request.get_json())
+            except ValueError as e:
+                return _json_response(400, {"error": str(e)})
+
+            start = time.perf_counter()
+            future = post_batch(actions)
+
+            try:
+                results = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(future)), timeout
+                )
+            except asyncio.TimeoutError:
+                if future.cancel():
+                    return _json_response(
+                        504, {"error": "Timed out waiting for the message loop"}
+                    )
+
+                # The batch started running just before the timeout
+                results = await asyncio.wrap_future(future)
+
+            return _json_response(
+                200,
+                {"results": results, "time_ms": (time.perf_counter() - start) * 1000},
+            )
+
+        return _json_response(404, {"error": "Not found"})
+
+    async def _stream_device_state(
+        self, request: _Request, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Streams the state of all devices as Server-Sent Events. The first event is
+        a ``snapshot`` of all values, followed by ``diff`` events containing only the
+        fields that changed, at most ``fps`` times a second.
+
+        Each client only keeps a position in the shared :class:`DeviceStateLog`, so a
+        slow client doesn't buffer stale values. It receives the latest value of each
+        changed field once it catches up, or a new snapshot if it fell too far
+        behind.
+        """
+        try:
+            fps = min(max(float(request.query.get("fps", 5)), 0.2), 30.0)
+        except ValueError:
+            fps = 5.0
+
+        # Keeps the kernel and transport buffers from hiding a slow client
+        writer.transport.set_write_buffer_limits(high=64 * 1024)
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+
+        sequence_number, snapshot = device_state.get_snapshot()
+        event, payload = b"snapshot", snapshot
+        last_write = time.monotonic()
+
+        while True:
+            if payload:
+                data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+                writer.write(b"event: " + event + b"\ndata: " + data + b"\n\n")
+                last_write = time.monotonic()
+            elif time.monotonic() - last_write > 15:
+                writer.write(b": keep-alive\n\n")
+                last_write = time.monotonic()
+
+            await writer.drain()
+            await asyncio.sleep(1 / fps)
+
+            changes = device_state.get_changes_since(sequence_number)
+
+            if changes is None:
+                sequence_number, payload = device_state.get_snapshot()
+                event = b"snapshot"
+            else:
+                sequence_number, payload = changes
+                event = b"diff"
+
+    async def _write_response(
+        self, writer: asyncio.StreamWriter, response: _Response, keep_alive: bool
+    ) -> None:
+        status, headers, body = response
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+
+        for key, value in headers.items():
+            lines.append(f"{key}: {value}")
+
+        lines.append(f"Content-Length: {len(body)}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
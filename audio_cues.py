@@ -0,0 +1,158 @@
+import abc
+import logging
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AudioBackend(abc.ABC):
+    """
+    Plays sound files for :class:`AudioCuePlayer`. Backends are only ever called
+    from the player's worker thread.
+    """
+
+    @abc.abstractmethod
+    def play(self, path: str) -> None:
+        pass
+
+    @abc.abstractmethod
+    def is_playing(self, path: str) -> bool:
+        pass
+
+
+class AfplayBackend(AudioBackend):
+    """
+    Plays sounds using the macOS ``afplay`` command. The player is started directly
+    rather than through a shell, so each cue costs a single process.
+    """
+
+    def __init__(self):
+        self._processes: Dict[str, subprocess.Popen] = {}
+        self.processes_started = 0
+
+    def play(self, path: str) -> None:
+        self._processes[path] = subprocess.Popen(
+            ["afplay", path],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.processes_started += 1
+
+    def is_playing(self, path: str) -> bool:
+        process = self._processes.get(path)
+
+        if process is None:
+            return False
+
+        if process.poll() is None:
+            return True
+
+        del self._processes[path]
+        return False
+
+
+class NullBackend(AudioBackend):
+    """
+    Doesn't play anything, but records the requests. Each sound is considered to
+    be playing for ``duration`` seconds.
+    """
+
+    def __init__(self, duration: float = 0.0):
+        self._duration = duration
+        self._started: Dict[str, float] = {}
+        self.played: List[str] = []
+
+    def play(self, path: str) -> None:
+        self._started[path] = time.monotonic()
+        self.played.append(path)
+
+    def is_playing(self, path: str) -> bool:
+        started = self._started.get(path)
+        return started is not None and time.monotonic() - started < self._duration
+
+
+def get_default_backend() -> AudioBackend:
+    if sys.platform == "darwin" and shutil.which("afplay") is not None:
+        return AfplayBackend()
+
+    return NullBackend()
+
+
+class AudioCuePlayer:
+    """
+    Plays short audio cues on a background thread. :meth:`play` never blocks.
+
+    Requests for a sound that is already waiting to be played, or is still playing,
+    are coalesced into the existing one, so that e.g. turning a dial quickly back
+    and forth across a boundary doesn't stack up copies of the same cue.
+    """
+
+    def __init__(self, backend: AudioBackend | None = None):
+        self._backend = backend if backend is not None else get_default_backend()
+        self._condition = threading.Condition()
+        self._pending: Dict[str, float] = {}
+        self._thread: threading.Thread | None = None
+
+        self.cues_requested = 0
+        self.cues_played = 0
+        self.cues_coalesced = 0
+
+        # Seconds between the call to play() and handing the cue to the backend
+        self.latencies: Deque[float] = deque(maxlen=100)
+
+    def get_backend(self) -> AudioBackend:
+        return self._backend
+
+    def play(self, path: str) -> None:
+        with self._condition:
+            self.cues_requested += 1
+
+            if path in self._pending:
+                self.cues_coalesced += 1
+                return
+
+            self._pending[path] = time.perf_counter()
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="audio_cues", daemon=True
+                )
+                self._thread.start()
+
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                cues: List[Tuple[str, float]] = list(self._pending.items())
+                self._pending.clear()
+
+            for path, requested_at in cues:
+                try:
+                    self._play_cue(path, requested_at)
+                except Exception:
+                    logger.exception(f"Failed to play {path}")
+
+    def _play_cue(self, path: str, requested_at: float) -> None:
+        if self._backend.is_playing(path):
+            with self._condition:
+                self.cues_coalesced += 1
+
+            return
+
+        self._backend.play(path)
+        self.cues_played += 1
+        self.latencies.append(time.perf_counter() - requested_at)
+
+
+audio_cues = AudioCuePlayer()
@@ -1,33 +1,47 @@
 import datetime
-import os
-from typing import Callable, Any
+import math
+from typing import Callable, Any, Dict
 
-from pyziggy.device_bases import LightWithColorTemp, LightWithColor, LightWithDimming
+from pyziggy.device_bases import LightWithColorTemp, LightWithDimming
 from pyziggy.message_loop import MessageLoopTimer
 from pyziggy.parameters import Broadcaster, NumericParameter
-from pyziggy.parameters import (
-    SettableBinaryParameter,
-    SettableToggleParameter,
-    SettableAndQueryableBinaryParameter,
-    SettableAndQueryableToggleParameter,
-)
 from pyziggy.util import LightWithDimmingScalable as L2S
 from pyziggy.util import ScaleMapper
 
-from astral_mired import MiredCalculator, TimeOfDay, EasyAstral
+from astral_mired import (
+    MiredCalculator,
+    TimeOfDay,
+    TimeOfDayEvent,
+    get_decimal_time,
+    get_local_datetime,
+)
+from audio_cues import audio_cues
+from daily_scheduler import DailyScheduler, DailyJob
 from device_helpers import (
+    BrightnessMover,
+    DeviceCapabilities,
     IkeaN2CommandRepeater,
     PhilipsTapDialRotaryHelper,
     PlugScalable,
+    ParameterWriteCache,
 )
+from metrics import count_publishes, instrument
 from pushover import send_push_notification_to_home_group
 from pyziggy_autogenerate.available_devices import (
     AvailableDevices,
     Philips_RDM002,
 )
 from secrets import get_secret_or_else
+from state_cache import create_state_cache
+from zigbee_groups import ZigbeeGroups
+
+TINK_SOUND = "/System/Library/Sounds/Tink.aiff"
+SUBMARINE_SOUND = "/System/Library/Sounds/Submarine.aiff"
 
 devices = AvailableDevices()
+count_publishes(devices)
+capabilities = DeviceCapabilities(devices)
+zigbee_groups = ZigbeeGroups(devices)
 
 kitchen = ScaleMapper(
     [
@@ -37,7 +51,7 @@ kitchen = ScaleMapper(
         (L2S(devices.kitchen_light), 0.95, 1.0),
     ],
     [0.55, 0.94],
-    lambda: os.system("afplay /System/Library/Sounds/Tink.aiff &"),
+    lambda: audio_cues.play(TINK_SOUND),
 )
 
 living_room_with_couch = ScaleMapper(
@@ -48,7 +62,7 @@ living_room_with_couch = ScaleMapper(
         (L2S(devices.tallbyn), 0.7, 1.0),
     ],
     [0.06],
-    lambda: os.system("afplay /System/Library/Sounds/Tink.aiff &"),
+    lambda: audio_cues.play(TINK_SOUND),
 )
 
 living_room_no_couch = ScaleMapper(
@@ -58,16 +72,16 @@ living_room_no_couch = ScaleMapper(
         (L2S(devices.standing_lamp), 0.5, 1.0),
     ],
     [0.06, 0.7],
-    lambda: os.system("afplay /System/Library/Sounds/Tink.aiff &"),
+    lambda: audio_cues.play(TINK_SOUND),
 )
 
 living_room = living_room_with_couch
 
+write_cache = ParameterWriteCache()
+
 
 def set_mired(mired):
-    for device in devices.get_devices():
-        if isinstance(device, LightWithColorTemp):
-            device.color_temp.set(mired)
+    color_temp_group.set("color_temp", mired)
 
 
 def ikea_remote_action_handler():
@@ -90,16 +104,28 @@ def ikea_remote_action_handler():
         set_mired(370)
 
 
+# The kitchen ScaleMapper switches lights on and off along its range, which the
+# lights can't do by themselves, so it's moved using timer repeats instead of a
+# device-side brightness move. They use the default RepeatConfig, a step every 0.5 s.
 ikea_remote_action_broadcaster = IkeaN2CommandRepeater(devices.ikea_remote)
-ikea_remote_action_broadcaster.repeating_action.add_listener(ikea_remote_action_handler)
+ikea_remote_action_broadcaster.repeating_action.add_listener(
+    instrument("ikea_remote_action_handler", ikea_remote_action_handler)
+)
+
+
+# The Fado is kept at no more than this brightness, see fado_brightness_clamp
+fado_max_brightness = 0.55
+
+bedroom_devices: list[LightWithDimming] = [devices.lampion, devices.fado]
+bedroom_brightness_mover = BrightnessMover(
+    bedroom_devices, max_brightness={devices.fado: fado_max_brightness}
+)
 
 
 def tradfri_remote_action_handler():
     action = devices.tradfri_remote.action.get_enum_value()
     types = devices.tradfri_remote.action.enum_type
 
-    bedroom_devices: list[LightWithDimming] = [devices.lampion, devices.fado]
-
     if action == types.toggle:
         state_to = 0 if bedroom_devices[0].state.get() else 1
         for device in bedroom_devices:
@@ -113,9 +139,19 @@ def tradfri_remote_action_handler():
     elif action == types.brightness_up_click:
         for device in bedroom_devices:
             device.brightness.add_normalized(0.2)
-
-
-devices.tradfri_remote.action.add_listener(tradfri_remote_action_handler)
+    elif action == types.brightness_up_hold:
+        bedroom_brightness_mover.start(1)
+    elif action == types.brightness_down_hold:
+        bedroom_brightness_mover.start(-1)
+    elif (
+        action == types.brightness_up_release or action == types.brightness_down_release
+    ):
+        bedroom_brightness_mover.stop()
+
+
+devices.tradfri_remote.action.add_listener(
+    instrument("tradfri_remote_action_handler", tradfri_remote_action_handler)
+)
 
 
 def kitchen_dimmer(step: int):
@@ -127,50 +163,44 @@ def living_room_dimmer(step: int):
 
 
 def hue_changer(step: int):
-    current_hue: float | None = None
+    lights = capabilities.lights_with_color
+
+    if not lights:
+        return
 
-    for device in devices.get_devices():
-        if isinstance(device, LightWithColor):
-            if current_hue is None:
-                current_hue = device.color_hs.hue.get()
+    current_hue = lights[0].color_hs.hue.get()
 
-            assert current_hue is not None
-            device.color_hs.hue.set((current_hue + step) % 360)
+    for device in lights:
+        write_cache.set(device.color_hs.hue, (current_hue + step) % 360)
 
 
 def saturation_changer(step: int):
-    current_saturation: float | None = None
+    lights = capabilities.lights_with_color
 
-    for device in devices.get_devices():
-        if isinstance(device, LightWithColor):
-            if current_saturation is None:
-                current_saturation = device.color_hs.saturation.get()
+    if not lights:
+        return
+
+    current_saturation = lights[0].color_hs.saturation.get()
 
-            assert current_saturation is not None
-            device.color_hs.saturation.set(current_saturation + step)
+    for device in lights:
+        write_cache.set(device.color_hs.saturation, current_saturation + step)
 
 
 device_params_turned_off: list | None = None
 
+everything_group = zigbee_groups.add("everything", capabilities.switchable_devices)
+
 
 def turn_off_everything():
     global device_params_turned_off
 
     new_device_params_turned_off = []
 
-    for device in devices.get_devices():
-        for name, param in vars(device).items():
-            if name == "state":
-                if (
-                    isinstance(param, SettableBinaryParameter)
-                    or isinstance(param, SettableAndQueryableBinaryParameter)
-                    or isinstance(param, SettableToggleParameter)
-                    or isinstance(param, SettableAndQueryableToggleParameter)
-                ):
-                    if param.get() > 0:
-                        new_device_params_turned_off.append(param)
+    for param in capabilities.switchable_states:
+        if param.get() > 0:
+            new_device_params_turned_off.append(param)
 
-                    param.set(0)
+    everything_group.set("state", 0)
 
     if new_device_params_turned_off:
         device_params_turned_off = new_device_params_turned_off
@@ -214,13 +244,17 @@ class PhilipsButtonHandler:
 
         self.philips_dial_handler = default_button_mapping[self.switch]
 
-        self.switch.action.add_listener(self.button_handler)
+        self.switch.action.add_listener(
+            instrument("philips_button_handler", self.button_handler)
+        )
 
         self._timer = MessageLoopTimer(self._timer_callback)
 
         self.rotary_helper = PhilipsTapDialRotaryHelper(self.switch)
         self.rotary_helper.on_rotate.add_listener(
-            lambda step: self.philips_dial_handler(step)
+            instrument(
+                "philips_dial_handler", lambda step: self.philips_dial_handler(step)
+            )
         )
 
     def button_handler(self):
@@ -261,33 +295,55 @@ philips_switches = (
 button_handlers = [PhilipsButtonHandler(s) for s in philips_switches]
 
 devices.fado.brightness.add_listener(
-    lambda: devices.fado.brightness.set_normalized(
-        min(0.55, devices.fado.brightness.get_normalized())
+    instrument(
+        "fado_brightness_clamp",
+        lambda: devices.fado.brightness.set_normalized(
+            min(fado_max_brightness, devices.fado.brightness.get_normalized())
+        ),
     )
 )
 
 office: list[LightWithDimming] = [devices.printer, devices.tokabo, devices.reading_lamp]
+office_group = zigbee_groups.add("office", office)
 
 
 def toggle_office():
     lights_are_off = any([light.state.get() == 0 for light in office])
 
-    for light in office:
-        if lights_are_off:
-            light.state.set(1)
-            light.brightness.set_normalized(1.0)
-        else:
-            light.state.set(0)
+    if lights_are_off:
+        office_group.set("state", 1)
+        office_group.set_normalized("brightness", 1.0)
+    else:
+        office_group.set("state", 0)
 
 
 def toggle_couch():
     devices.couch.state.set(0 if devices.couch.state.get() > 0 else 1)
 
 
+location = get_secret_or_else("location", (47.402339, 19.251788, 0.0))
+
+
 class AutoColorTemp:
-    def __init__(self):
+    """
+    Broadcasts a change whenever the automatic color temperature changes.
+
+    By default, the mired value is recalculated every 10 seconds. In event driven
+    mode the value is quantized to multiples of ``quantum``, and a one-shot timer
+    is armed for the moment the schedule crosses into the next quantum, or for at
+    most a minute, after which the time of the next change is re-evaluated. This
+    way the flat parts of the schedule cost one callback a minute instead of six.
+    """
+
+    _MAX_WAKEUP_DAYS_KEPT = 7
+
+    # Like in DailyScheduler, re-arming at least this often bounds the error caused
+    # by the monotonic clock of MessageLoopTimer drifting from the wall-clock time.
+    _MAX_TIMER_DURATION = 60.0
+
+    def __init__(self, event_driven: bool = False, quantum: float = 1.0):
         self._calculator = MiredCalculator(
-            get_secret_or_else("location", (47.402339, 19.251788, 0.0)),
+            location,
             [
                 (2.0, 417),
                 (TimeOfDay.SUNRISE - 0.5, 370),
@@ -298,81 +354,136 @@ class AutoColorTemp:
                 (24, 417),  # 2400 K late night
             ],
         )
+        self._event_driven = event_driven
+        self._quantum = quantum
+        self._wakeups_per_day: Dict[datetime.date, int] = {}
         self._timer = MessageLoopTimer(self._timer_callback)
-        self._last_mired = self._calculator.get_current_mired()
+        self._last_mired = self._calculate_mired()
         self.on_change = Broadcaster()
 
     def get_mired(self):
         return self._last_mired
 
+    def get_wakeups_per_day(self) -> Dict[datetime.date, int]:
+        """
+        Returns the number of timer callbacks for each of the last few days.
+        """
+        return dict(self._wakeups_per_day)
+
     def start(self):
-        self._timer.start(10)
+        if self._event_driven:
+            self._arm_timer()
+        else:
+            self._timer.start(10)
 
     def stop(self):
         self._timer.stop()
 
+    def _calculate_mired(self, for_time_hr_decimal: float | None = None) -> float:
+        mired = self._calculator.get_current_mired(for_time_hr_decimal)
+
+        if not self._event_driven:
+            return mired
+
+        return math.floor(mired / self._quantum + 0.5) * self._quantum
+
+    def _arm_timer(self):
+        now = datetime.datetime.now()
+        now_decimal = get_decimal_time(now)
+        mired = self._calculate_mired(now_decimal)
+        half_quantum = self._quantum / 2
+
+        next_change = self._calculator.get_time_of_next_crossing(
+            mired - half_quantum, mired + half_quantum, now_decimal
+        )
+
+        # Wake up at midnight at the latest, so that the rest of the schedule is
+        # calculated using the sun times of the new day.
+        wake_up_at = 24.0 if next_change is None else min(next_change, 24.0)
+        wake_up_time = get_local_datetime(now.date(), wake_up_at).timestamp()
+        seconds = wake_up_time - now.timestamp()
+
+        self._timer.start(min(max(1.0, seconds), AutoColorTemp._MAX_TIMER_DURATION))
+
+    def _count_wakeup(self):
+        today = datetime.date.today()
+        self._wakeups_per_day[today] = self._wakeups_per_day.get(today, 0) + 1
+
+        while len(self._wakeups_per_day) > AutoColorTemp._MAX_WAKEUP_DAYS_KEPT:
+            del self._wakeups_per_day[min(self._wakeups_per_day)]
+
     def _timer_callback(self, timer: MessageLoopTimer):
-        new_mired = self._calculator.get_current_mired()
+        self._count_wakeup()
+
+        if self._event_driven:
+            timer.stop()
+
+        new_mired = self._calculate_mired()
 
         if new_mired != self._last_mired:
-            self.on_change._call_listeners()
             self._last_mired = new_mired
+            self.on_change._call_listeners()
 
+        if self._event_driven:
+            self._arm_timer()
 
-auto_color_temp = AutoColorTemp()
 
-lights_with_color_temp: list[LightWithColorTemp] = [
-    l for l in devices.get_devices() if isinstance(l, LightWithColorTemp)
-]
+auto_color_temp = AutoColorTemp(event_driven=True)
+
+lights_with_color_temp: list[LightWithColorTemp] = list(
+    capabilities.lights_with_color_temp
+)
+color_temp_group = zigbee_groups.add("lights_with_color_temp", lights_with_color_temp)
 
 
 def change_mired_for_light(light: LightWithColorTemp):
     if light.state.get() > 0:
-        light.color_temp.set(auto_color_temp.get_mired())
+        write_cache.set(light.color_temp, auto_color_temp.get_mired())
 
 
 for light in lights_with_color_temp:
-    light.state.add_listener(lambda light=light: change_mired_for_light(light))  # type: ignore
+    light.state.add_listener(
+        instrument(
+            "change_mired_for_light",
+            lambda light=light: change_mired_for_light(light),  # type: ignore
+        )
+    )
 
 
 def change_mired():
     for light in lights_with_color_temp:
-        light.color_temp.set(auto_color_temp.get_mired())
+        write_cache.set_when_on(light, light.color_temp, auto_color_temp.get_mired())
 
 
-auto_color_temp.on_change.add_listener(change_mired)
+auto_color_temp.on_change.add_listener(instrument("change_mired", change_mired))
 devices.on_connect.add_listener(lambda: auto_color_temp.start())
 
 
+daily_scheduler = DailyScheduler(location)
+devices.on_connect.add_listener(lambda: daily_scheduler.start())
+
+
 class OnceADay:
-    def __init__(self, time_hr_decimal: float, callback: Callable[[], Any]):
-        self._time_hr_decimal = time_hr_decimal
+    """
+    Calls the callback every day at the specified time, starting with the next
+    occurrence after :meth:`start` has been called.
+    """
+
+    def __init__(
+        self, time_of_day: float | TimeOfDayEvent, callback: Callable[[], Any]
+    ):
+        self._time_of_day = time_of_day
         self._callback = callback
-
-        # Ensure that we only fire if the specified time is in the future
-        self._day_of_last_execution = (
-            OnceADay.get_day() - 1
-            if EasyAstral.get_now_decimal() < self._time_hr_decimal
-            else OnceADay.get_day()
-        )
-        self._timer = MessageLoopTimer(self._timer_callback)
+        self._job: DailyJob | None = None
 
     def start(self):
-        self._timer.start(5)
-
-    @staticmethod
-    def get_day():
-        return datetime.datetime.now().day
-
-    def _timer_callback(self, timer: MessageLoopTimer):
-        current_day = OnceADay.get_day()
+        if self._job is None:
+            self._job = daily_scheduler.add(self._time_of_day, self._callback)
 
-        if (
-            current_day != self._day_of_last_execution
-            and EasyAstral.get_now_decimal() > self._time_hr_decimal
-        ):
-            self._day_of_last_execution = current_day
-            self._callback()
+    def stop(self):
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
 
 
 morning_lights: list[LightWithDimming] = [
@@ -386,18 +497,25 @@ morning_lights: list[LightWithDimming] = [
     devices.dining_light_1,
     devices.dining_light_2,
 ]
+morning_group = zigbee_groups.add("morning_lights", morning_lights)
+
+
+# Lights that are turned on at less than full brightness in the morning
+morning_light_brightness: Dict[LightWithDimming, float] = {
+    devices.dining_light_1: 0.5,
+    devices.dining_light_2: 0.5,
+}
 
 
 def turn_on_morning_lights():
-    for light in morning_lights:
-        light.state.set(1)
-        light.brightness.set_normalized(1)
+    morning_group.set("state", 1)
+    morning_group.set_values_normalized(
+        "brightness",
+        {light: morning_light_brightness.get(light, 1) for light in morning_lights},
+    )
 
     devices.plug.state.set(1)
 
-    for light in [devices.dining_light_1, devices.dining_light_2]:
-        light.brightness.set_normalized(0.5)
-
 
 turn_on_lights_in_the_morning = OnceADay(8.5, turn_on_morning_lights)
 devices.on_connect.add_listener(lambda: turn_on_lights_in_the_morning.start())
@@ -411,7 +529,7 @@ class WaterSensorAlert:
 
     def timer_callback(self, timer: MessageLoopTimer):
         if self.callback_counter % 1 == 0:
-            os.system("afplay /System/Library/Sounds/Submarine.aiff &")
+            audio_cues.play(SUBMARINE_SOUND)
 
         if self.callback_counter % 10 == 0:
             send_push_notification_to_home_group("Water sensor alert!")
@@ -441,7 +559,9 @@ def activate_water_sensor_alert():
             water_sensor_alert = None
 
 
-devices.dishwasher_leak_sensor.water_leak.add_listener(activate_water_sensor_alert)
+devices.dishwasher_leak_sensor.water_leak.add_listener(
+    instrument("activate_water_sensor_alert", activate_water_sensor_alert)
+)
 
 
 class Tv(Broadcaster):
@@ -449,7 +569,7 @@ class Tv(Broadcaster):
         super().__init__()
         self._is_on: bool | None = False
 
-        current.add_listener(self._current_listener)
+        current.add_listener(instrument("tv_current_listener", self._current_listener))
 
     def _current_listener(self):
         new_is_on = devices.ikea_smart_plug.current.get() > 0.4
@@ -472,3 +592,34 @@ class Tv(Broadcaster):
 
 
 tv_state = Tv(devices.ikea_smart_plug.current)
+
+
+# Restores the last known parameter values and device_params_turned_off before
+# connecting, so that everything above works correctly right after a restart
+state_cache = create_state_cache(devices)
+
+if state_cache is not None:
+    cache = state_cache
+
+    def get_device_params_turned_off_keys() -> list | None:
+        if device_params_turned_off is None:
+            return None
+
+        return [cache.get_key(param) for param in device_params_turned_off]
+
+    def set_device_params_turned_off_keys(keys: list | None) -> None:
+        global device_params_turned_off
+
+        if keys is None:
+            device_params_turned_off = None
+            return
+
+        params = [cache.get_parameter(key) for key in keys]
+        device_params_turned_off = [p for p in params if p is not None] or None
+
+    cache.register(
+        "device_params_turned_off",
+        get_device_params_turned_off_keys,
+        set_device_params_turned_off_keys,
+    )
+    cache.rehydrate()
@@ -0,0 +1,243 @@
+"""
+Measures the latency between a remote button press and the resulting command,
+while many HTTP clients poll ``/pyziggy/state``, for the Flask and the asyncio
+front ends.
+
+The automation in :mod:`automation` runs against an :class:`InProcessMqttClientImpl`.
+A button press is an injected ``on``/``off`` action of the IKEA remote, and its
+latency is the time until the dining light's ``/set`` message is published. The
+HTTP load comes from a separate process, so that only the server shares the
+message thread's interpreter.
+
+The Flask app is served by werkzeug's single-threaded default server, with the
+same ``make_server`` call as ``pyziggy run``.
+
+Usage::
+
+    python benchmarks/async_http_benchmark.py
+    python benchmarks/async_http_benchmark.py --clients 500 --seconds 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pyziggy.message_loop import message_loop
+from pyziggy.workarounds import applied_workarounds
+
+from in_process_mqtt import use_in_process_impl
+from loop_monitor import get_percentiles
+import state_cache
+
+PRESS_INTERVAL = 0.05
+
+
+async def _run_client(
+    port: int, deadline: float, counts: Dict[str, int], path: bytes
+) -> None:
+    request = b"GET " + path + b" HTTP/1.1\r\nHost: localhost\r\n\r\n"
+    reader: asyncio.StreamReader | None = None
+    writer: asyncio.StreamWriter | None = None
+
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+            assert reader is not None
+            writer.write(request)
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+
+            await reader.readexactly(length)
+            counts["requests"] += 1
+
+            if b"connection: close" in head.lower():
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            counts["errors"] += 1
+            writer = None
+            await asyncio.sleep(0.1)
+
+    if writer is not None:
+        writer.close()
+
+
+def run_load(port: int, clients: int, seconds: float) -> None:
+    """
+    Keeps ``clients`` keep-alive connections busy requesting the state of all
+    devices, and prints the number of completed requests and errors.
+    """
+    counts = {"requests": 0, "errors": 0}
+    deadline = time.perf_counter() + seconds
+
+    async def run() -> None:
+        await asyncio.gather(
+            *(
+                _run_client(port, deadline, counts, b"/pyziggy/state")
+                for _ in range(clients)
+            )
+        )
+
+    asyncio.run(run())
+    print(counts["requests"], counts["errors"])
+
+
+def start_server(frontend: str) -> int:
+    """
+    :return: The port of the started server.
+    """
+    if frontend == "asyncio":
+        from async_http_interface import AsyncHttpServer
+
+        server = AsyncHttpServer(host="127.0.0.1", port=0, max_connections=4096)
+        server.start()
+        return server.get_port()
+
+    from werkzeug.serving import make_server
+
+    from http_interface import app
+
+    # Like pyziggy.run._ThreadedFlaskRunner, which only runs serve_forever() on a
+    # thread of its own, but doesn't handle the requests on separate threads
+    werkzeug_server = make_server("127.0.0.1", 0, app)
+    threading.Thread(target=werkzeug_server.serve_forever, daemon=True).start()
+    return werkzeug_server.server_port
+
+
+def run_configuration(frontend: str, clients: int, seconds: float) -> Dict[str, Any]:
+    state_cache.enabled = False
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import automation
+
+        impl = use_in_process_impl(automation.devices)
+        applied_workarounds._apply(automation.devices)
+        port = start_server(frontend) if frontend != "none" else 0
+
+    devices = automation.devices
+    remote_topic = f"zigbee2mqtt/{devices.ikea_remote._get_topic()}"
+    light_topic = f"zigbee2mqtt/{devices.dining_light_1._get_topic()}/set"
+
+    press_times: Deque[float] = deque()
+    latencies: List[float] = []
+
+    def on_publish(topic: str, payload: Dict[str, Any]) -> None:
+        if topic == light_topic and "state" in payload and press_times:
+            latencies.append(time.perf_counter() - press_times.popleft())
+
+    impl.on_publish.add_listener(on_publish)
+
+    connected = threading.Event()
+    devices.on_connect.add_listener(connected.set)
+    result: Dict[str, Any] = {}
+
+    def press_buttons() -> None:
+        connected.wait()
+        time.sleep(1)
+
+        load = None
+
+        if frontend != "none":
+            load = subprocess.Popen(
+                [sys.executable, __file__, "--load", str(port), str(clients)]
+                + ["--seconds", str(seconds + 1)],
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+
+            # Lets the clients connect
+            time.sleep(1)
+
+        end = time.perf_counter() + seconds
+        action = "on"
+
+        while time.perf_counter() < end:
+            press_times.append(time.perf_counter())
+            impl.inject(remote_topic, {"action": action})
+            action = "off" if action == "on" else "on"
+            time.sleep(PRESS_INTERVAL)
+
+        if load is not None:
+            output, _ = load.communicate()
+            requests, errors = output.split()
+            result["http_requests_per_second"] = int(requests) / (seconds + 1)
+            result["http_errors"] = int(errors)
+
+        time.sleep(0.5)
+        message_loop.post_message(message_loop.stop)
+
+    thread = threading.Thread(target=press_buttons)
+    thread.start()
+
+    devices._set_skip_initial_query(True)
+    devices._connect("in-process", 0, 0, "zigbee2mqtt")
+    devices._loop_forever()
+    thread.join()
+
+    result["latency_ms"] = get_percentiles([v * 1000 for v in latencies])
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--frontends", nargs="+", default=["none", "flask", "asyncio"])
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--load", nargs=2, type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load is not None:
+        run_load(args.load[0], args.load[1], args.seconds)
+        return 0
+
+    if args.run is not None:
+        print(json.dumps(run_configuration(args.run, args.clients, args.seconds)))
+        return 0
+
+    print(
+        f"{'front end':>10}  {'requests/s':>10}  {'errors':>6}"
+        f"  {'p50 ms':>7}  {'p99 ms':>7}  {'max ms':>7}"
+    )
+
+    for frontend in args.frontends:
+        # The automation and the message loop are singletons, so each
+        # configuration runs in a fresh process
+        output = subprocess.run(
+            [sys.executable, __file__, "--run", frontend]
+            + ["--clients", str(args.clients), "--seconds", str(args.seconds)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        latency = result["latency_ms"]
+        rate = result.get("http_requests_per_second", 0)
+
+        print(
+            f"{frontend:>10}  {rate:10.0f}  {result.get('http_errors', 0):6d}"
+            f"  {latency['p50']:7.2f}  {latency['p99']:7.2f}  {latency['max']:7.2f}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
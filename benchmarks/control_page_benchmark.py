@@ -0,0 +1,136 @@
+"""
+Load test for the ``/pyziggy`` control page, which is rendered once into a
+:class:`CompiledPage`, compared to rendering the template on every request like
+``http_pyziggy_help`` used to.
+
+The previous handler is added to the Flask app as ``/pyziggy/uncompiled``. Each
+variant is requested ``--requests`` times in a row, each on a new connection, from
+the werkzeug server with the same ``make_server`` call as ``pyziggy run``, and from
+the asyncio front end. The Flask test client rows show the cost of the handler
+alone, without the HTTP server.
+
+Usage::
+
+    python benchmarks/control_page_benchmark.py
+    python benchmarks/control_page_benchmark.py --requests 5000
+"""
+
+import argparse
+import contextlib
+import http.client
+import io
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import state_cache
+
+# The benchmark must neither read nor overwrite the real cache
+state_cache.enabled = False
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from async_http_interface import AsyncHttpServer
+    from http_interface import app, commands, control_page, make_html
+
+from werkzeug.serving import make_server
+
+
+def http_pyziggy_help_uncompiled() -> Tuple[str, int]:
+    # The previous http_pyziggy_help
+    html = make_html(
+        "Send commands to <code>/pyziggy/post</code>.",
+        [{"action": action} for action in commands],
+    )
+    return html, 200
+
+
+app.add_url_rule("/pyziggy/uncompiled", view_func=http_pyziggy_help_uncompiled)
+
+
+def measure(
+    port: int, path: str, headers: Dict[str, str], requests: int
+) -> Tuple[float, int]:
+    """
+    :return: The requests per second, and the size of the last response's body.
+    """
+    start = time.perf_counter()
+    size = 0
+
+    for _ in range(requests):
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        size = len(response.read())
+        connection.close()
+
+    return requests / (time.perf_counter() - start), size
+
+
+def measure_test_client(path: str, headers: Dict[str, str], requests: int) -> float:
+    client = app.test_client()
+    start = time.perf_counter()
+
+    for _ in range(requests):
+        client.get(path, headers=headers)
+
+    return requests / (time.perf_counter() - start)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Don't log each request
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    werkzeug_server = make_server("127.0.0.1", 0, app)
+    threading.Thread(target=werkzeug_server.serve_forever, daemon=True).start()
+
+    async_server = AsyncHttpServer(host="127.0.0.1", port=0)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        async_server.start()
+
+    control_page.update_if_necessary()
+    gzip = {"Accept-Encoding": "gzip"}
+    etag = {"Accept-Encoding": "gzip", "If-None-Match": f'"{control_page.etag}-gzip"'}
+
+    variants = [
+        ("before", "/pyziggy/uncompiled", {}),
+        ("after, identity", "/pyziggy", {}),
+        ("after, gzip", "/pyziggy", gzip),
+        ("after, 304", "/pyziggy", etag),
+    ]
+
+    print(f"{'server':<12}  {'variant':<16}  {'requests/s':>10}  {'bytes':>6}")
+
+    for server, port in (
+        ("werkzeug", werkzeug_server.server_port),
+        ("asyncio", async_server.get_port()),
+    ):
+        for name, path, headers in variants:
+            # The asyncio front end only serves the compiled page
+            if server == "asyncio" and path != "/pyziggy":
+                continue
+
+            rate, size = measure(port, path, headers, args.requests)
+            print(f"{server:<12}  {name:<16}  {rate:>10.0f}  {size:>6}")
+
+    for name, path, headers in variants:
+        rate = measure_test_client(path, headers, args.requests)
+        print(f"{'test client':<12}  {name:<16}  {rate:>10.0f}")
+
+    werkzeug_server.shutdown()
+    async_server.stop()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
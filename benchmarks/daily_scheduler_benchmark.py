@@ -0,0 +1,153 @@
+"""
+Measures the idle CPU cost of daily jobs, registered with the heap based
+:class:`DailyScheduler`, compared to one polling timer per job like ``OnceADay``
+used to run.
+
+Each configuration runs the message loop in a separate process for ``--seconds``
+seconds, with the jobs spread randomly across the day, and reports the CPU time
+the process used after registering the jobs.
+
+Usage::
+
+    python benchmarks/daily_scheduler_benchmark.py
+    python benchmarks/daily_scheduler_benchmark.py --seconds 30 --jobs 10 1000 10000
+"""
+
+import argparse
+import datetime
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pyziggy.message_loop import MessageLoopTimer, message_loop
+
+from astral_mired import get_decimal_time
+from daily_scheduler import DailyScheduler
+
+LOCATION = (52.5, 13.4, 34)
+
+
+def measure_idle_cpu(seconds: float, setup: Callable[[], Callable[[], None]]) -> float:
+    """
+    Runs the message loop for ``seconds`` after calling ``setup``, and calls the
+    function it returns to clean up.
+
+    :return: The CPU time used while the loop was running, in percent. The time
+             spent in ``setup`` isn't included.
+    """
+
+    def stop(timer: MessageLoopTimer) -> None:
+        timer.stop()
+        message_loop.stop()
+
+    stop_timer = MessageLoopTimer(stop)
+    tear_down: List[Callable[[], None]] = []
+    starts: List[float] = []
+
+    def start() -> None:
+        tear_down.append(setup())
+        stop_timer.start(seconds)
+        starts.extend((time.process_time(), time.perf_counter()))
+
+    message_loop.post_message(start)
+    message_loop.run()
+    cpu = time.process_time() - starts[0]
+    wall = time.perf_counter() - starts[1]
+
+    for function in tear_down:
+        function()
+
+    return cpu / wall * 100
+
+
+def setup_scheduler(job_count: int, rng: random.Random) -> Callable[[], None]:
+    scheduler = DailyScheduler(LOCATION)
+
+    for _ in range(job_count):
+        scheduler.add(rng.uniform(0, 24), lambda: None)
+
+    scheduler.start()
+    return scheduler.stop
+
+
+def setup_polling_timers(job_count: int, rng: random.Random) -> Callable[[], None]:
+    timers: List[MessageLoopTimer] = []
+
+    for _ in range(job_count):
+        time_of_day = rng.uniform(0, 24)
+        state = {"day": datetime.datetime.now().day}
+
+        # What each OnceADay instance did every 5 seconds before the scheduler
+        def poll(timer: MessageLoopTimer, time_of_day=time_of_day, state=state):
+            now = datetime.datetime.now()
+
+            if now.day != state["day"] and get_decimal_time(now) > time_of_day:
+                state["day"] = now.day
+
+        timer = MessageLoopTimer(poll)
+        timer.start(5)
+        timers.append(timer)
+
+    def stop() -> None:
+        for timer in timers:
+            timer.stop()
+
+    return stop
+
+
+def run_in_subprocess(mode: str, job_count: int, seconds: float) -> float:
+    # pyziggy's timer threads and messages left behind by a configuration would
+    # distort the next one, so each runs in a fresh process
+    output = subprocess.run(
+        [sys.executable, __file__, "--seconds", str(seconds)]
+        + ["--run", mode, str(job_count)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(output)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument(
+        "--max-polling-jobs",
+        type=int,
+        default=1000,
+        help="skip the polling baseline above this many jobs, it can't keep up",
+    )
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        mode, job_count = args.run[0], int(args.run[1])
+        setup = setup_scheduler if mode == "scheduler" else setup_polling_timers
+        rng = random.Random(0)
+        print(measure_idle_cpu(args.seconds, lambda: setup(job_count, rng)))
+        return 0
+
+    print(f"{'jobs':>8}  {'scheduler CPU %':>16}  {'polling CPU %':>14}")
+
+    for job_count in args.jobs:
+        scheduler_cpu = run_in_subprocess("scheduler", job_count, args.seconds)
+
+        if job_count <= args.max_polling_jobs:
+            polling_cpu = run_in_subprocess("polling", job_count, args.seconds)
+            polling_text = f"{polling_cpu:14.2f}"
+        else:
+            polling_text = f"{'-':>14}"
+
+        print(f"{job_count:8d}  {scheduler_cpu:16.2f}  {polling_text}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Measures how long it takes to find the devices and parameters of a kind with the
+prebuilt :class:`DeviceCapabilities` index, compared to scanning all devices with
+``isinstance`` on each call like automation.py used to.
+
+The fleet is ``AvailableDevices`` with ``--devices`` simulated devices added by
+:func:`fleet_simulator.add_simulated_devices`. Only the lookups are timed, not the
+parameter writes that follow them in automation.py.
+
+Usage::
+
+    python benchmarks/device_capabilities_benchmark.py
+    python benchmarks/device_capabilities_benchmark.py --devices 500
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pyziggy.device_bases import LightWithColor, LightWithColorTemp
+from pyziggy.devices_client import DevicesClient
+from pyziggy.parameters import (
+    SettableAndQueryableBinaryParameter,
+    SettableAndQueryableToggleParameter,
+    SettableBinaryParameter,
+    SettableToggleParameter,
+)
+
+from device_helpers import DeviceCapabilities
+from fleet_simulator import _get_device_type_counts, add_simulated_devices
+from pyziggy_autogenerate.available_devices import AvailableDevices
+
+
+def scan_lights_with_color(devices: DevicesClient) -> List[Any]:
+    # Like hue_changer and saturation_changer
+    return [d for d in devices.get_devices() if isinstance(d, LightWithColor)]
+
+
+def scan_lights_with_color_temp(devices: DevicesClient) -> List[Any]:
+    # Like set_mired
+    return [d for d in devices.get_devices() if isinstance(d, LightWithColorTemp)]
+
+
+def scan_switchable_states(devices: DevicesClient) -> List[Any]:
+    # Like turn_off_everything
+    states = []
+
+    for device in devices.get_devices():
+        for name, param in vars(device).items():
+            if name == "state":
+                if (
+                    isinstance(param, SettableBinaryParameter)
+                    or isinstance(param, SettableAndQueryableBinaryParameter)
+                    or isinstance(param, SettableToggleParameter)
+                    or isinstance(param, SettableAndQueryableToggleParameter)
+                ):
+                    states.append(param)
+
+    return states
+
+
+def measure(function: Callable[[], Any]) -> float:
+    """
+    :return: The average duration of a call in microseconds. The calls are repeated
+             until they took at least half a second.
+    """
+    calls = 0
+    start = time.perf_counter()
+
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+
+        if elapsed > 0.5:
+            return elapsed / calls * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--devices",
+        type=int,
+        default=5000,
+        help="the number of simulated devices to add",
+    )
+    args = parser.parse_args()
+
+    client_type = add_simulated_devices(
+        AvailableDevices, _get_device_type_counts(AvailableDevices, args.devices, [])
+    )
+    devices = client_type()
+
+    start = time.perf_counter()
+    capabilities = DeviceCapabilities(devices)
+    build_time = time.perf_counter() - start
+
+    print(f"Devices:            {len(devices.get_devices())}")
+    print(f"Building the index: {build_time * 1000:.1f} ms")
+    print()
+    print(f"{'lookup':<24}  {'count':>6}  {'scan us':>9}  {'index us':>9}")
+
+    lookups = [
+        (
+            "lights_with_color",
+            scan_lights_with_color,
+            lambda: list(capabilities.lights_with_color),
+        ),
+        (
+            "lights_with_color_temp",
+            scan_lights_with_color_temp,
+            lambda: list(capabilities.lights_with_color_temp),
+        ),
+        (
+            "switchable_states",
+            scan_switchable_states,
+            lambda: list(capabilities.switchable_states),
+        ),
+    ]
+
+    for name, scan, lookup in lookups:
+        scanned = scan(devices)
+
+        if scanned != lookup():
+            raise AssertionError(f"The scan and the index differ for {name}")
+
+        print(
+            f"{name:<24}  {len(scanned):>6}  {measure(lambda: scan(devices)):>9.1f}"
+            f"  {measure(lookup):>9.1f}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Measures the memory used by the pyziggy device and parameter objects of a large
+fleet, and how much of it compact parameter storage could save at most.
+
+The fleet is ``AvailableDevices`` with ``--devices`` simulated devices added by
+:func:`fleet_simulator.add_simulated_devices`, in the proportion the device types
+occur in ``available_devices.py``. Memory is measured with :mod:`tracemalloc`.
+
+The parameter objects have to stay, as they implement ``get()``, ``set()`` and
+``add_listener``, and pyziggy dispatches the zigbee2mqtt messages to them. Compact
+storage could only replace their attribute dicts, e.g. with ``__slots__``, and
+move their values into an ``array('d')``. The report shows the size of those dicts
+and of such an array next to the total.
+
+Usage::
+
+    python benchmarks/device_memory_benchmark.py
+    python benchmarks/device_memory_benchmark.py --devices 2000
+"""
+
+import argparse
+import array
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from device_state import get_leaf_parameters
+from fleet_simulator import _get_device_type_counts, add_simulated_devices
+from pyziggy_autogenerate.available_devices import AvailableDevices
+
+KIB = 1024
+MIB = 1024 * 1024
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--devices",
+        type=int,
+        default=10000,
+        help="the number of simulated devices to add",
+    )
+    args = parser.parse_args()
+
+    client_type = add_simulated_devices(
+        AvailableDevices, _get_device_type_counts(AvailableDevices, args.devices, [])
+    )
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    devices = client_type()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    device_count = len(devices.get_devices())
+    params = [
+        param
+        for device in devices.get_devices()
+        for _, param in get_leaf_parameters(device)
+    ]
+    dict_size = sum(sys.getsizeof(vars(param)) for param in params)
+    values = array.array("d", (param.get() for param in params))
+    values_size = values.itemsize * len(values)
+
+    print(f"Devices:          {device_count}")
+    print(f"Leaf parameters:  {len(params)}")
+    print(
+        f"Total:            {total / MIB:.1f} MiB, "
+        f"{total / device_count / KIB:.1f} KiB per device"
+    )
+    print(
+        f"Parameter dicts:  {dict_size / MIB:.1f} MiB, "
+        f"{dict_size / device_count / KIB:.2f} KiB per device"
+    )
+    print(
+        f"Values as array:  {values_size / MIB:.2f} MiB, "
+        f"{values_size / device_count:.0f} B per device"
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Measures the cost of serving ``/pyziggy/state`` from the per-device JSON cached by
+:class:`DeviceStateLog`, compared to walking all devices and serializing every
+parameter on each request.
+
+The fleet is ``AvailableDevices`` with ``--devices`` simulated devices added by
+:func:`fleet_simulator.add_simulated_devices`. Before each request, the
+``linkquality`` of a number of random devices changes, like it would when they
+report. The cached document is checked against a full walk after every round.
+
+Usage::
+
+    python benchmarks/device_state_benchmark.py
+    python benchmarks/device_state_benchmark.py --devices 500 --changed 0 5 50
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pyziggy.devices_client import DevicesClient
+from pyziggy.parameters import NumericParameter
+
+from device_state import DeviceStateLog, get_json_value, get_leaf_parameters
+from fleet_simulator import _get_device_type_counts, add_simulated_devices
+from pyziggy_autogenerate.available_devices import AvailableDevices
+
+
+def walk_and_dump(devices: DevicesClient) -> bytes:
+    state = {
+        device._get_topic(): {
+            field: get_json_value(param) for field, param in get_leaf_parameters(device)
+        }
+        for device in devices.get_devices()
+    }
+    return json.dumps(state, separators=(",", ":")).encode("utf-8")
+
+
+def report(param: NumericParameter, value: Any) -> None:
+    # What pyziggy does for each parameter of an inbound message
+    param._set_reported_value(value)
+    param._call_listeners_if_necessary()
+
+
+def measure(before: Callable[[], Any], function: Callable[[], Any]) -> float:
+    """
+    :return: The average duration of ``function`` in microseconds, excluding the
+             duration of ``before``, which is called before each call. The calls are
+             repeated until they took at least half a second.
+    """
+    calls = 0
+    total = 0.0
+
+    while total < 0.5:
+        before()
+        start = time.perf_counter()
+        function()
+        total += time.perf_counter() - start
+        calls += 1
+
+    return total / calls * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--devices",
+        type=int,
+        default=2000,
+        help="the number of simulated devices to add",
+    )
+    parser.add_argument("--changed", type=int, nargs="+", default=[0, 1, 10, 100, 1000])
+    args = parser.parse_args()
+
+    client_type = add_simulated_devices(
+        AvailableDevices, _get_device_type_counts(AvailableDevices, args.devices, [])
+    )
+    devices = client_type()
+    state_log = DeviceStateLog(devices)
+    rng = random.Random(0)
+
+    link_qualities: List[NumericParameter] = [
+        param
+        for device in devices.get_devices()
+        for field, param in get_leaf_parameters(device)
+        if field == "linkquality"
+    ]
+
+    def change(count: int) -> None:
+        for param in rng.sample(link_qualities, count):
+            report(param, (param.get() + rng.randint(1, 254)) % 255)
+
+    size = len(walk_and_dump(devices))
+    walk_cost = measure(lambda: None, lambda: walk_and_dump(devices))
+
+    print(f"Devices:            {len(devices.get_devices())}")
+    print(f"Document size:      {size / 1024:.0f} KiB")
+    print(f"Walk and dump:      {walk_cost:.0f} us")
+    print()
+    print(f"{'changed devices':>15}  {'cached us':>10}")
+
+    for count in args.changed:
+        cost = measure(lambda: change(count), state_log.get_state_json)
+
+        if json.loads(state_log.get_state_json()) != json.loads(walk_and_dump(devices)):
+            raise AssertionError("The cached document differs from a full walk")
+
+        print(f"{count:>15}  {cost:>10.1f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Measures the cost of :meth:`MiredCalculator.get_current_mired`, which looks the time
+up in a table compiled once per astral day, compared to resolving and scanning the
+whole schedule on every call like it used to.
+
+The 7 breakpoint schedule is the one of ``AutoColorTemp`` in automation.py, the
+larger ones have breakpoints at random times of the day. Both implementations are
+queried at the same random times, and their results are checked to be equal.
+
+Usage::
+
+    python benchmarks/mired_calculator_benchmark.py
+    python benchmarks/mired_calculator_benchmark.py --breakpoints 7 1000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from astral_mired import EasyAstral, MiredCalculator, TimeOfDay, TimeOfDayEvent
+
+LOCATION = (47.402339, 19.251788, 0.0)
+
+_Schedule = List[Tuple[float, float] | Tuple[TimeOfDayEvent, float]]
+
+
+class LinearScanMiredCalculator(MiredCalculator):
+    """
+    The previous implementation of :meth:`get_current_mired`, which resolves the
+    schedule and scans it on every call.
+    """
+
+    def get_current_mired(self, for_time_hr_decimal: float | None = None):
+        now = (
+            for_time_hr_decimal
+            if for_time_hr_decimal is not None
+            else EasyAstral.get_now_decimal()
+        )
+
+        d = [self._get_time_and_value(item) for item in self._values]
+
+        for i in range(len(d) - 1):
+            assert (
+                d[i][0] < d[i + 1][0]
+            ), f"Times passed to MiredCalculator must be in ascending order."
+
+        new_d: list[Tuple[float, float]] = []
+
+        for t, value in d:
+            new_d.append((t - 24, value))
+
+        for t, value in d:
+            new_d.append((t, value))
+
+        for t, value in d:
+            new_d.append((t + 24, value))
+
+        d = new_d
+
+        prev = None
+        next = None
+
+        for t, value in d:
+            if t > now:
+                next = (t, value)
+                break
+
+            prev = (t, value)
+
+        if prev is None and next is not None:
+            return next[1]
+
+        if next is None and prev is not None:
+            return prev[1]
+
+        assert prev is not None
+        assert next is not None
+
+        a, v1 = prev
+        b, v2 = next
+
+        return v1 + (v2 - v1) * (now - a) / (b - a)
+
+
+def create_schedule(breakpoints: int, rng: random.Random) -> _Schedule:
+    if breakpoints == 7:
+        return [
+            (2.0, 417),
+            (TimeOfDay.SUNRISE - 0.5, 370),
+            (TimeOfDay.SUNRISE + 0.5, 179),
+            (TimeOfDay.SUNSET - 1, 179),
+            (TimeOfDay.SUNSET, 370),
+            (23, 370),
+            (24, 417),
+        ]
+
+    times = sorted(set(rng.uniform(0, 24) for _ in range(breakpoints)))
+    return [(t, rng.uniform(153, 500)) for t in times]
+
+
+def measure(get_mired: Callable[[float], float], queries: List[float]) -> float:
+    """
+    :return: The average cost of a query in microseconds. The queries are repeated
+             until they took at least half a second.
+    """
+    repeats = 0
+    start = time.perf_counter()
+
+    while True:
+        for now in queries:
+            get_mired(now)
+
+        repeats += 1
+        elapsed = time.perf_counter() - start
+
+        if elapsed > 0.5:
+            return elapsed / (repeats * len(queries)) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--breakpoints", type=int, nargs="+", default=[7, 100, 10000])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'breakpoints':>11}  {'before us':>10}  {'after us':>9}  {'speedup':>7}")
+
+    for breakpoints in args.breakpoints:
+        schedule = create_schedule(breakpoints, rng)
+        compiled = MiredCalculator(LOCATION, schedule)
+        linear_scan = LinearScanMiredCalculator(LOCATION, schedule)
+        queries = [rng.uniform(0, 24) for _ in range(100)]
+
+        for now in queries:
+            if compiled.get_current_mired(now) != linear_scan.get_current_mired(now):
+                raise AssertionError(f"The results differ at {now}")
+
+        # The table is compiled by the first query above, like it is once a day
+        before = measure(linear_scan.get_current_mired, queries[:10])
+        after = measure(compiled.get_current_mired, queries)
+
+        print(
+            f"{breakpoints:>11}  {before:>10.1f}  {after:>9.1f}  "
+            f"{before / after:>6.0f}x"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
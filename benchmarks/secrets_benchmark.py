@@ -0,0 +1,85 @@
+"""
+Measures the cost of looking up a secret with :class:`SecretsStore`, compared to
+parsing ``secrets.json`` on every lookup like ``get_secret_or_else`` used to.
+
+The secrets file is a temporary one with ``--keys`` keys. The first lookup of a new
+store includes parsing the file, which is what happens at startup.
+
+Usage::
+
+    python benchmarks/secrets_benchmark.py
+    python benchmarks/secrets_benchmark.py --keys 500
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from secrets import SecretsStore
+
+
+def get_secret_or_else_uncached(path: Path, key: str, default: Any) -> Any:
+    # The previous get_secret_or_else
+    if not path.exists():
+        return default
+
+    with open(path, "r") as f:
+        data = json.load(f)
+
+        if key not in data:
+            return default
+
+        return data[key]
+
+
+def measure(function: Callable[[], Any]) -> float:
+    """
+    :return: The average duration of a call in microseconds. The calls are repeated
+             until they took at least half a second.
+    """
+    calls = 0
+    start = time.perf_counter()
+
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+
+        if elapsed > 0.5:
+            return elapsed / calls * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--keys", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "secrets.json"
+        secrets: Dict[str, Any] = {
+            f"key_{i}": f"value_{i:032d}" for i in range(args.keys)
+        }
+        secrets["location"] = [47.402339, 19.251788, 0.0]
+        path.write_text(json.dumps(secrets, indent=2))
+
+        store = SecretsStore(path)
+        uncached = measure(lambda: get_secret_or_else_uncached(path, "location", None))
+        first = measure(lambda: SecretsStore(path).get("location", None))
+        repeated = measure(lambda: store.get("location", None))
+
+    print(f"Keys in secrets.json:           {len(secrets)}")
+    print(f"Parsing on every lookup:        {uncached:.1f} us")
+    print(f"SecretsStore, first lookup:     {first:.1f} us")
+    print(f"SecretsStore, repeated lookups: {repeated:.2f} us")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+import datetime
+import heapq
+import logging
+from typing import Callable, Any, Dict, List, Tuple
+
+import pyziggy.message_loop as ml
+from pyziggy.message_loop import MessageLoopTimer
+
+from astral_mired import EasyAstral, TimeOfDayEvent, get_local_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class DailyJob:
+    """
+    Returned by :meth:`DailyScheduler.add`. Call :meth:`cancel` to stop receiving
+    callbacks.
+    """
+
+    def __init__(
+        self, time_of_day: float | TimeOfDayEvent, callback: Callable[[], Any]
+    ):
+        self._time_of_day = time_of_day
+        self._callback = callback
+        self._deadline: float = 0
+        self._cancelled = False
+
+    def cancel(self) -> None:
+        self._cancelled = True
+
+
+class DailyScheduler:
+    """
+    Calls each registered job once a day, either at a fixed time of day or at a sun
+    event with an optional offset e.g. ``TimeOfDay.SUNSET - 0.5``.
+
+    The absolute deadlines of all jobs are kept in a min-heap, and a single
+    MessageLoopTimer is armed for the nearest one, so the number of wakeups doesn't
+    depend on the number of jobs.
+
+    Deadlines are calculated from the local wall-clock time of each day, so jobs
+    keep firing at the same wall-clock time across DST transitions. A job fires at
+    most once a day, even if its wall-clock time occurs twice.
+
+    Time is read from pyziggy's ``time_source``, so the scheduler can be fast
+    forwarded together with the MessageLoopTimers. An exception raised by a job is
+    logged, and doesn't keep the other jobs from being called.
+    """
+
+    # MessageLoopTimer measures time using a monotonic clock, which may not advance
+    # while the machine sleeps and doesn't follow wall-clock adjustments. Re-arming
+    # the timer at least this often bounds the error this can cause.
+    _MAX_TIMER_DURATION = 60.0
+
+    def __init__(self, lat_long_height: Tuple[float, float, float]):
+        self._astral = EasyAstral(lat_long_height)
+        self._sun_times: Dict[datetime.date, Dict[str, float]] = {}
+        self._heap: List[Tuple[float, int, DailyJob]] = []
+        self._push_counter = 0
+        self._timer = MessageLoopTimer(self._timer_callback)
+        self._running = False
+
+    def add(
+        self, time_of_day: float | TimeOfDayEvent, callback: Callable[[], Any]
+    ) -> DailyJob:
+        """
+        Registers a callback that will be called every day at the specified time.
+        The first call happens at the next occurrence of that time.
+
+        :param time_of_day: Either a time in decimal hours i.e. 8.5 for 8:30, or a
+                            :class:`TimeOfDayEvent` such as ``TimeOfDay.SUNRISE + 1``.
+        """
+        job = DailyJob(time_of_day, callback)
+        self._push(job, ml.time_source.time())
+
+        if self._running:
+            self._arm_timer()
+
+        return job
+
+    def start(self) -> None:
+        self._running = True
+        self._arm_timer()
+
+    def stop(self) -> None:
+        self._running = False
+        self._timer.stop()
+
+    def _get_sun_times(self, date: datetime.date) -> Dict[str, float]:
+        if date not in self._sun_times:
+            if len(self._sun_times) > 4:
+                del self._sun_times[min(self._sun_times)]
+
+            self._sun_times[date] = self._astral.get_sun_times_for_date(date)
+
+        return self._sun_times[date]
+
+    def _get_deadline(self, job: DailyJob, date: datetime.date) -> float:
+        time_of_day = job._time_of_day
+
+        if isinstance(time_of_day, TimeOfDayEvent):
+            hours = self._get_sun_times(date)[time_of_day._name] + time_of_day._offset
+        else:
+            hours = time_of_day
+
+        return get_local_datetime(date, hours).timestamp()
+
+    def _push(self, job: DailyJob, after: float) -> None:
+        today = datetime.date.fromtimestamp(after)
+
+        # Offsets can move an occurrence into the neighbouring days, so yesterday's
+        # occurrence may still be ahead of us.
+        for days in range(-1, 3):
+            deadline = self._get_deadline(job, today + datetime.timedelta(days=days))
+
+            if deadline > after:
+                break
+
+        job._deadline = deadline
+        heapq.heappush(self._heap, (deadline, self._push_counter, job))
+        self._push_counter += 1
+
+    def _arm_timer(self) -> None:
+        while self._heap and self._heap[0][2]._cancelled:
+            heapq.heappop(self._heap)
+
+        if not self._heap:
+            self._timer.stop()
+            return
+
+        seconds = self._heap[0][0] - ml.time_source.time()
+        self._timer.start(min(max(seconds, 0.001), DailyScheduler._MAX_TIMER_DURATION))
+
+    def _timer_callback(self, timer: MessageLoopTimer) -> None:
+        timer.stop()
+        now = ml.time_source.time()
+
+        try:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, job = heapq.heappop(self._heap)
+
+                if job._cancelled:
+                    continue
+
+                self._push(job, max(now, job._deadline))
+
+                try:
+                    job._callback()
+                except Exception:
+                    logger.exception(f"Daily job {job._callback} raised an exception")
+        finally:
+            self._arm_timer()
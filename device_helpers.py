@@ -1,7 +1,18 @@
-from typing import final
+from typing import final, Any, Dict, List, Sequence, Tuple
 
+from pyziggy.device_bases import LightWithDimming, LightWithColorTemp, LightWithColor
+from pyziggy.devices_client import Device, DevicesClient
 from pyziggy.message_loop import MessageLoopTimer
-from pyziggy.parameters import Broadcaster, AnyBroadcaster
+from pyziggy.parameters import (
+    Broadcaster,
+    AnyBroadcaster,
+    NumericParameter,
+    SettableNumericParameter,
+    SettableBinaryParameter,
+    SettableToggleParameter,
+    SettableAndQueryableBinaryParameter,
+    SettableAndQueryableToggleParameter,
+)
 from pyziggy.util import Scalable
 
 from pyziggy_autogenerate.available_devices import (
@@ -10,29 +21,71 @@ from pyziggy_autogenerate.available_devices import (
     Tuya_TS011F,
 )
 
+from metrics import instrument
+
+
+class RepeatConfig:
+    """
+    Describes how a held action is repeated by :class:`RepeatingActionBroadcaster`.
+
+    The first repeat happens ``interval`` seconds after the action. Each following
+    interval is shorter by a factor of ``1 - acceleration``, but not shorter than
+    ``min_interval``.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        acceleration: float = 0.0,
+        min_interval: float = 0.1,
+    ):
+        self.interval = interval
+        self.acceleration = acceleration
+        self.min_interval = min_interval
+
 
 class RepeatingActionBroadcaster:
-    def __init__(self, action, repeating_values):
+    def __init__(
+        self,
+        action,
+        repeating_values,
+        repeat_configs: Dict[Any, RepeatConfig] | None = None,
+    ):
         self.repeating_action: Broadcaster = Broadcaster()
         self._action = action
         self._repeating_values = repeating_values
+        self._repeat_configs = repeat_configs if repeat_configs is not None else {}
+        self._repeat_config = RepeatConfig()
+        self._interval = 0.0
         self._timer = MessageLoopTimer(self._timer_callback)
 
-        self._action.add_listener(self._action_listener)
+        self._action.add_listener(
+            instrument("repeating_action_listener", self._action_listener)
+        )
 
     def _action_listener(self):
-        self._timer_callback(self._timer)
+        self.repeating_action._call_listeners()
 
         action_value = self._action.get_enum_value()
 
         if action_value in self._repeating_values:
-            self._timer.start(0.5)
+            self._repeat_config = self._repeat_configs.get(action_value, RepeatConfig())
+            self._interval = self._repeat_config.interval
+            self._timer.start(self._interval)
         else:
             self._timer.stop()
 
     def _timer_callback(self, timer: MessageLoopTimer):
         self.repeating_action._call_listeners()
 
+        config = self._repeat_config
+
+        if config.acceleration > 0 and self._interval > config.min_interval:
+            self._interval = max(
+                config.min_interval, self._interval * (1 - config.acceleration)
+            )
+            timer.start(self._interval)
+
 
 class IkeaN2CommandRepeater(RepeatingActionBroadcaster):
     """
@@ -42,7 +95,11 @@ class IkeaN2CommandRepeater(RepeatingActionBroadcaster):
     the button is released.
     """
 
-    def __init__(self, remote: IKEA_Remote_Control_N2):
+    def __init__(
+        self,
+        remote: IKEA_Remote_Control_N2,
+        repeat_configs: Dict[Any, RepeatConfig] | None = None,
+    ):
         t = remote.action.enum_type
         super().__init__(
             remote.action,
@@ -52,9 +109,89 @@ class IkeaN2CommandRepeater(RepeatingActionBroadcaster):
                 t.arrow_left_hold,
                 t.arrow_right_hold,
             ],
+            repeat_configs,
         )
 
 
+class BrightnessMover:
+    """
+    Changes the brightness of lights continuously while a button is held, using the
+    zigbee2mqtt ``brightness_move`` command. The lights do the fading themselves, so
+    a hold costs one message per light when it starts and one when it stops,
+    instead of a message every repeat interval.
+
+    An open-ended move would take lights past a limit that the automation enforces
+    on their reports, so lights with a ``max_brightness`` are instead sent a
+    transition to their limit when moving up, taking as long as the move would.
+
+    Only lights that are on are moved. The lights are asked to report their final
+    brightness after the move is stopped.
+    """
+
+    def __init__(
+        self,
+        lights: Sequence[LightWithDimming],
+        rate: float = 60,
+        max_brightness: Dict[Any, float] | None = None,
+    ):
+        """
+        :param rate: The speed of the change in raw brightness units per second.
+        :param max_brightness: The normalized brightness limit of some of the lights.
+        """
+        self._lights = lights
+        self._rate = rate
+        self._max_brightness = max_brightness if max_brightness is not None else {}
+        self._moving: List[Device] = []
+
+    def start(self, direction: int) -> None:
+        """
+        :param direction: 1 to increase the brightness, -1 to decrease it.
+        """
+        self.stop()
+
+        for light in self._lights:
+            assert isinstance(light, Device)
+
+            if not light.is_connected() or light.state.get() == 0:
+                continue
+
+            if direction > 0 and light in self._max_brightness:
+                brightness = light.brightness
+                target = round(
+                    self._max_brightness[light]
+                    * (brightness._max_value - brightness._min_value)
+                    + brightness._min_value
+                )
+                distance = target - brightness.get()
+
+                if distance <= 0:
+                    continue
+
+                light.publish(
+                    {
+                        "brightness": target,
+                        "transition": round(distance / self._rate, 1),
+                    }
+                )
+            else:
+                light.publish({"brightness_move": direction * self._rate})
+
+            self._moving.append(light)
+
+    def stop(self) -> None:
+        for device in self._moving:
+            # Also stops a transition
+            device.publish({"brightness_move": 0})
+            device.query({"brightness": ""})
+
+            # The value cached by pyziggy is out of date until the light reports the
+            # brightness it stopped at
+            assert isinstance(device, LightWithDimming)
+            device.brightness.mark_as_stale()
+
+        self._moving = []
+
+
 class PhilipsTapDialRotaryHelper:
     """
     Use `on_rotate.add_listener()` to subscribe to a sanitized variant of the dial
@@ -64,19 +201,41 @@ class PhilipsTapDialRotaryHelper:
     size of 255. This class filters those out, so you can be sure that the action
     was emitted due to the turning of the dial.
 
+    The first step of a rotation is emitted immediately. Steps arriving within the
+    following ``frame`` seconds are summed and emitted together at the end of the
+    frame, so a fast spin results in one listener call per frame instead of one per
+    MQTT message.
+
+    With a non-zero ``acceleration`` the summed step is scaled up by
+    ``1 + acceleration * abs(step) / 255``, so turning the dial faster covers a
+    larger range.
+
     Example:
         `rotary_helper.on_rotate.add_listener(lambda step: print(step))`
     """
 
-    def __init__(self, remote: Philips_RDM002):
+    def __init__(
+        self, remote: Philips_RDM002, frame: float = 0.08, acceleration: float = 0.0
+    ):
         self.on_rotate = AnyBroadcaster()
         self._remote = remote
-        self._remote.action.add_listener(self._on_action)
+        self._remote.action.add_listener(
+            instrument("tap_dial_action_listener", self._on_action)
+        )
         self._suppress_step_255: bool = False
         self._step_255_suppression_timer: MessageLoopTimer = MessageLoopTimer(
             self._stop_suppress_step_255
         )
 
+        self._frame = frame
+        self._acceleration = acceleration
+        self._frame_timer = MessageLoopTimer(self._end_frame)
+        self._in_frame = False
+        self._pending_step = 0
+
+        self.steps_received = 0
+        self.rotations_emitted = 0
+
     def _start_suppress_step_255(self):
         self._suppress_step_255 = True
         self._step_255_suppression_timer.start(1)
@@ -97,9 +256,9 @@ class PhilipsTapDialRotaryHelper:
             return
 
         if action == t.brightness_step_up:
-            self.on_rotate._call_listeners(lambda l: l(step))
+            self._add_step(int(step))
         elif action == t.brightness_step_down:
-            self.on_rotate._call_listeners(lambda l: l(-step))
+            self._add_step(-int(step))
         elif (
             action == t.button_1_press
             or action == t.button_2_press
@@ -108,6 +267,34 @@ class PhilipsTapDialRotaryHelper:
         ):
             self._start_suppress_step_255()
 
+    def _add_step(self, step: int):
+        self.steps_received += 1
+
+        if self._in_frame:
+            self._pending_step += step
+            return
+
+        self._in_frame = True
+        self._frame_timer.start(self._frame)
+        self._emit(step)
+
+    def _end_frame(self, timer: MessageLoopTimer):
+        if self._pending_step == 0:
+            self._in_frame = False
+            timer.stop()
+            return
+
+        step = self._pending_step
+        self._pending_step = 0
+        self._emit(step)
+
+    def _emit(self, step: int):
+        if self._acceleration > 0:
+            step = round(step * (1 + self._acceleration * abs(step) / 255))
+
+        self.rotations_emitted += 1
+        self.on_rotate._call_listeners(lambda l: l(step))
+
 
 class PlugScalable(Scalable):
     def __init__(self, plug: Tuya_TS011F):
@@ -126,3 +313,130 @@ class PlugScalable(Scalable):
     @final
     def get_normalized(self) -> float:
         return self._last_value
+
+
+class ParameterWriteCache:
+    """
+    Opt-in outbound layer for settable parameters. Writes made with
+    :meth:`set_when_on` to lights that are off are deferred, and only sent once the
+    light turns on.
+
+    Writes that wouldn't change anything are already dropped by ``set()`` itself,
+    unless the parameter was marked as stale, so they are always passed on to it.
+    The ``sent`` counter counts the writes that result in a publish, ``suppressed``
+    those that don't, and ``deferred`` the writes that waited for a light to turn
+    on. Together they can be used to measure the reduction in Zigbee traffic.
+    """
+
+    def __init__(self):
+        self.sent = 0
+        self.suppressed = 0
+        self.deferred = 0
+        self._deferred_writes: Dict[
+            NumericParameter, Dict[SettableNumericParameter, float]
+        ] = {}
+
+    def set(self, param: SettableNumericParameter, value: float) -> None:
+        # set() decides whether the value is sent with the next publish of the
+        # device. Several writes during one callback share that publish.
+        was_pending = param._should_send_to_device
+        param.set(value)
+
+        if param._should_send_to_device and not was_pending:
+            self.sent += 1
+        else:
+            self.suppressed += 1
+
+    def set_when_on(
+        self, light: LightWithDimming, param: SettableNumericParameter, value: float
+    ) -> None:
+        if light.state.get() > 0:
+            self._deferred_writes.get(light.state, {}).pop(param, None)
+            self.set(param, value)
+            return
+
+        if light.state not in self._deferred_writes:
+            self._deferred_writes[light.state] = {}
+            light.state.add_listener(
+                instrument(
+                    "write_cache_flush", lambda: self._flush_deferred_writes(light)
+                )
+            )
+
+        self._deferred_writes[light.state][param] = value
+        self.deferred += 1
+
+    def _flush_deferred_writes(self, light: LightWithDimming) -> None:
+        if light.state.get() == 0:
+            return
+
+        writes = self._deferred_writes.get(light.state, {})
+
+        while writes:
+            param, value = writes.popitem()
+            self.set(param, value)
+
+
+class DeviceCapabilities:
+    """
+    Groups the devices of a DevicesClient by capability. The index is built once,
+    so that operations on all devices of a kind don't need to scan the devices and
+    their members with ``isinstance`` each time.
+
+    The index reflects the devices that exist when the object is created.
+    """
+
+    SENSOR_PROPERTIES = (
+        "temperature",
+        "humidity",
+        "water_leak",
+        "occupancy",
+        "contact",
+        "illuminance",
+    )
+
+    def __init__(self, devices: DevicesClient):
+        all_devices = devices.get_devices()
+
+        self.lights_with_dimming: Tuple[LightWithDimming, ...] = tuple(
+            d for d in all_devices if isinstance(d, LightWithDimming)
+        )
+        self.lights_with_color_temp: Tuple[LightWithColorTemp, ...] = tuple(
+            d for d in all_devices if isinstance(d, LightWithColorTemp)
+        )
+        self.lights_with_color: Tuple[LightWithColor, ...] = tuple(
+            d for d in all_devices if isinstance(d, LightWithColor)
+        )
+
+        # Devices with a settable on/off "state" parameter, and those parameters
+        self.switchable_devices: Tuple[Device, ...] = tuple(
+            d
+            for d in all_devices
+            if isinstance(
+                vars(d).get("state"),
+                (
+                    SettableBinaryParameter,
+                    SettableAndQueryableBinaryParameter,
+                    SettableToggleParameter,
+                    SettableAndQueryableToggleParameter,
+                ),
+            )
+        )
+        self.switchable_states: Tuple[SettableNumericParameter, ...] = tuple(
+            vars(d)["state"] for d in self.switchable_devices
+        )
+
+        self.battery_params: Tuple[NumericParameter, ...] = tuple(
+            vars(d)["battery"]
+            for d in all_devices
+            if isinstance(vars(d).get("battery"), NumericParameter)
+        )
+        self.sensors: Tuple[Device, ...] = tuple(
+            d
+            for d in all_devices
+            if any(
+                isinstance(vars(d).get(p), NumericParameter)
+                and not isinstance(vars(d).get(p), SettableNumericParameter)
+                for p in DeviceCapabilities.SENSOR_PROPERTIES
+            )
+        )
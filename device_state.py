@@ -0,0 +1,195 @@
+import functools
+import json
+import threading
+from typing import Any, Dict, List, Set, Tuple
+
+from pyziggy.devices_client import Device, DevicesClient
+from pyziggy.parameters import CompositeParameter, EnumParameter, NumericParameter
+
+
+def get_leaf_parameters(device: Device) -> List[Tuple[str, NumericParameter]]:
+    """
+    :return: The numeric parameters of the device with their field names. Members of
+             composite parameters are named like ``"color_hs.hue"``.
+    """
+    result: List[Tuple[str, NumericParameter]] = []
+
+    for name, member in vars(device).items():
+        if name.startswith("_"):
+            continue
+
+        if isinstance(member, NumericParameter):
+            result.append((name, member))
+        elif isinstance(member, CompositeParameter):
+            for sub_name, sub_member in vars(member).items():
+                if not sub_name.startswith("_") and isinstance(
+                    sub_member, NumericParameter
+                ):
+                    result.append((f"{name}.{sub_name}", sub_member))
+
+    return result
+
+
+def get_json_value(param: NumericParameter) -> Any:
+    """
+    :return: The value of the parameter as it should appear in JSON. Enums are
+             represented by their names, integral values as integers.
+    """
+    value = param.get()
+
+    if isinstance(param, EnumParameter):
+        return param._transform_internal_to_mqtt_value(value)
+
+    return int(value) if value.is_integer() else value
+
+
+class DeviceStateLog:
+    """
+    Keeps the latest value of every parameter of every device, and a log of the
+    fields that changed, so that any number of readers on other threads can catch
+    up with the changes since they last looked.
+
+    Writes happen in parameter listeners on the message thread, and cost O(1)
+    regardless of the number of readers. Each reader only keeps a sequence number.
+    Reading the changes since a sequence number returns the latest value of each
+    changed field, so intermediate values of fields that changed multiple times are
+    dropped. A reader that fell behind by more than ``capacity`` changes has to
+    start again from a snapshot.
+
+    The JSON serialization of each device's state is cached, and only the devices
+    that changed since the last call are serialized again.
+    """
+
+    def __init__(self, devices: DevicesClient, capacity: int = 4096):
+        self._capacity = capacity
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[str, Any]] = {}
+        self._log: List[Tuple[str, str]] = []
+        self._log_start = 0
+
+        self._device_json: Dict[str, bytes] = {}
+
+        # The '"name":{...}' members of the state object, in the order of the devices
+        self._state_members: List[bytes] = []
+        self._state_member_indices: Dict[str, int] = {}
+        self._dirty_devices: Set[str] = set()
+        self._state_json: bytes | None = None
+
+        for device in devices.get_devices():
+            device_name = device._get_topic()
+            self._values[device_name] = {}
+            self._state_member_indices[device_name] = len(self._state_members)
+            self._state_members.append(b"")
+            self._dirty_devices.add(device_name)
+
+            for field, param in get_leaf_parameters(device):
+                self._values[device_name][field] = get_json_value(param)
+                param.add_listener(
+                    functools.partial(self._on_change, device_name, field, param)
+                )
+
+    def get_sequence_number(self) -> int:
+        """
+        :return: The sequence number of the next change.
+        """
+        with self._lock:
+            return self._log_start + len(self._log)
+
+    def get_snapshot(self) -> Tuple[int, Dict[str, Dict[str, Any]]]:
+        """
+        :return: The sequence number of the next change, and a copy of all values.
+        """
+        with self._lock:
+            return self._log_start + len(self._log), {
+                device: dict(fields) for device, fields in self._values.items()
+            }
+
+    def get_changes_since(
+        self, sequence_number: int
+    ) -> Tuple[int, Dict[str, Dict[str, Any]]] | None:
+        """
+        :return: The sequence number of the next change, and the current values of
+                 the fields that changed since ``sequence_number``. None if the
+                 changes are no longer available, and a snapshot is required.
+        """
+        with self._lock:
+            if sequence_number < self._log_start:
+                return None
+
+            changes: Dict[str, Dict[str, Any]] = {}
+
+            for device, field in self._log[sequence_number - self._log_start :]:
+                changes.setdefault(device, {})[field] = self._values[device][field]
+
+            return self._log_start + len(self._log), changes
+
+    def get_state_json(self) -> bytes:
+        """
+        :return: The state of all devices as a JSON object keyed by device name.
+        """
+        with self._lock:
+            if self._dirty_devices or self._state_json is None:
+                self._update_device_json()
+                self._state_json = b"{" + b",".join(self._state_members) + b"}"
+
+            return self._state_json
+
+    def get_device_json(self, device: str) -> bytes | None:
+        """
+        :return: The state of a single device as a JSON object, or None if there is
+                 no device with this name.
+        """
+        with self._lock:
+            if device not in self._values:
+                return None
+
+            if device in self._dirty_devices:
+                self._update_device_json()
+
+            return self._device_json[device]
+
+    def _update_device_json(self) -> None:
+        for device in self._dirty_devices:
+            fragment = json.dumps(self._values[device], separators=(",", ":"))
+            self._device_json[device] = fragment.encode("utf-8")
+            self._state_members[self._state_member_indices[device]] = (
+                f"{json.dumps(device)}:{fragment}".encode("utf-8")
+            )
+
+        self._dirty_devices.clear()
+
+    def _on_change(self, device: str, field: str, param: NumericParameter) -> None:
+        value = get_json_value(param)
+
+        with self._lock:
+            if self._values[device][field] == value:
+                return
+
+            self._values[device][field] = value
+            self._log.append((device, field))
+            self._dirty_devices.add(device)
+            self._state_json = None
+
+            # Trimming in halves keeps the cost of appending amortized O(1)
+            if len(self._log) >= 2 * self._capacity:
+                del self._log[: self._capacity]
+                self._log_start += self._capacity
+
+
+_device_state_logs: Dict[DevicesClient, DeviceStateLog] = {}
+
+
+def get_device_state_log(devices: DevicesClient) -> DeviceStateLog:
+    """
+    :return: The DeviceStateLog of ``devices``, which is created on the first call.
+             The HTTP interfaces and the state cache share it, so that each
+             parameter change is only logged once.
+
+    The log reads the current values when it's created, so the first call must come
+    after the state cache restored its values. automation.py does that before
+    anything else can call this.
+    """
+    if devices not in _device_state_logs:
+        _device_state_logs[devices] = DeviceStateLog(devices)
+
+    return _device_state_logs[devices]
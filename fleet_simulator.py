@@ -0,0 +1,688 @@
+"""
+Emulates a zigbee2mqtt network for load testing the automation in
+:mod:`automation`, without a broker or any hardware.
+
+Virtual devices are derived from the parameters of the generated pyziggy device
+classes, so every type in ``available_devices.py`` is supported. They answer
+``/set`` and ``/get`` messages with state echoes after a configurable latency, lose
+a configurable fraction of their messages, and sensors and remotes send reports at
+configurable rates.
+
+The fleet can be grown beyond the devices in ``available_devices.py`` with
+additional copies of the generated device types. These are part of the ``devices``
+object that :mod:`automation` creates, so functions like ``turn_off_everything``
+and ``change_mired`` operate on all of them.
+
+Usage::
+
+    python fleet_simulator.py --devices 2000 --latency 20 --jitter 10 --loss 0.01
+    python fleet_simulator.py --device-type Innr_RB_279_T=1000 --duration 30
+"""
+
+import argparse
+import heapq
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Type
+
+from pyziggy.devices_client import Device, DevicesClient
+from pyziggy.message_loop import message_loop
+from pyziggy.parameters import (
+    CompositeParameter,
+    EnumParameter,
+    NumericParameter,
+    ParameterBase,
+    SettableNumericParameter,
+    ToggleParameter,
+)
+from pyziggy.workarounds import applied_workarounds
+
+from device_helpers import DeviceCapabilities
+from in_process_mqtt import InProcessMqttClientImpl, use_in_process_impl
+from loop_monitor import loop_monitor
+import state_cache
+from zigbee_groups import ZigbeeGroups
+
+logger = logging.getLogger(__name__)
+
+# Plausible ranges for properties that the generated classes only bound by the int32
+# range
+_VALUE_RANGES: Dict[str, Tuple[float, float]] = {
+    "temperature": (15, 28),
+    "humidity": (30, 70),
+    "illuminance": (0, 1000),
+    "battery": (20, 100),
+    "linkquality": (20, 255),
+    "power": (0, 2000),
+    "current": (0, 10),
+    "voltage": (220, 240),
+    "energy": (0, 1000),
+}
+
+
+def _get_top_level_parameters(device: Device) -> List[ParameterBase]:
+    return [
+        member
+        for name, member in vars(device).items()
+        if not name.startswith("_") and isinstance(member, ParameterBase)
+    ]
+
+
+def _get_value_range(param: NumericParameter) -> Tuple[float, float]:
+    low, high = _VALUE_RANGES.get(
+        param.get_property_name(), (param._min_value, param._max_value)
+    )
+    return max(low, param._min_value), min(high, param._max_value)
+
+
+def _get_initial_value(param: NumericParameter, rng: random.Random) -> Any:
+    if isinstance(param, (EnumParameter, ToggleParameter)):
+        # Enums start at their first value, switches start out on
+        internal_value = 0.0 if isinstance(param, EnumParameter) else 1.0
+    elif param._min_value == 0 and param._max_value == 1:
+        internal_value = 0.0
+    else:
+        low, high = _get_value_range(param)
+        internal_value = float(round(rng.uniform(low, high)))
+
+    return param._transform_internal_to_mqtt_value(internal_value)
+
+
+class VirtualDevice:
+    """
+    The zigbee2mqtt side of a pyziggy :class:`Device`. The state is kept as MQTT
+    values keyed by property, the way zigbee2mqtt publishes it.
+    """
+
+    def __init__(self, device: Device, rng: random.Random):
+        self.name = device._get_topic()
+        self.state: Dict[str, Any] = {}
+        self._params: Dict[str, NumericParameter] = {}
+        self._settable: Dict[str, NumericParameter] = {}
+        self._report_params: List[NumericParameter] = []
+        self._actions: List[str] = []
+
+        for param in _get_top_level_parameters(device):
+            property = param.get_property_name()
+
+            if isinstance(param, CompositeParameter):
+                composite = self.state.setdefault(property, {})
+
+                for sub_param in param._get_subparameters():
+                    assert isinstance(sub_param, NumericParameter)
+                    sub_property = sub_param.get_property_name()
+                    composite[sub_property] = _get_initial_value(sub_param, rng)
+                    self._params[f"{property}.{sub_property}"] = sub_param
+
+                    if isinstance(sub_param, SettableNumericParameter):
+                        self._settable[f"{property}.{sub_property}"] = sub_param
+
+                continue
+
+            if not isinstance(param, NumericParameter):
+                continue
+
+            if property == "action" and isinstance(param, EnumParameter):
+                self._actions = list(param._enum_values)
+                continue
+
+            self.state[property] = _get_initial_value(param, rng)
+            self._params[property] = param
+
+            if isinstance(param, SettableNumericParameter):
+                self._settable[property] = param
+            elif not isinstance(param, EnumParameter):
+                self._report_params.append(param)
+
+        self.is_sensor = any(
+            p.get_property_name() in DeviceCapabilities.SENSOR_PROPERTIES
+            for p in self._report_params
+        )
+
+    def is_remote(self) -> bool:
+        return bool(self._actions)
+
+    def get_state_payload(self) -> Dict[str, Any]:
+        return {k: dict(v) if isinstance(v, dict) else v for k, v in self.state.items()}
+
+    def apply_set(self, payload: Dict[str, Any]) -> None:
+        """
+        Applies the writable properties of a ``/set`` payload like zigbee2mqtt
+        would, ignoring the rest.
+        """
+        for property, value in payload.items():
+            if isinstance(value, dict):
+                for sub_property, sub_value in value.items():
+                    key = f"{property}.{sub_property}"
+
+                    if key in self._settable:
+                        self.state[property][sub_property] = self._get_valid_value(
+                            self._settable[key], sub_value
+                        )
+            elif property in self._settable:
+                self.state[property] = self._get_valid_value(
+                    self._settable[property], value
+                )
+            elif property == "brightness_step" and "brightness" in self._settable:
+                self.state["brightness"] = self._get_valid_value(
+                    self._settable["brightness"], self.state["brightness"] + value
+                )
+
+        # Lights turn on when their brightness is set
+        if (
+            "state" not in payload
+            and "state" in self._settable
+            and payload.get("brightness", 0) > 0
+        ):
+            self.state["state"] = "ON"
+
+    def create_report(self, rng: random.Random) -> Dict[str, Any]:
+        """
+        :return: A report of all non-settable properties, with numeric values moved
+                 a little from their previous value.
+        """
+        for param in self._report_params:
+            property = param.get_property_name()
+            low, high = _get_value_range(param)
+
+            if param._min_value == 0 and param._max_value == 1:
+                continue
+
+            step = (high - low) * 0.02
+            value = self.state[property] + rng.uniform(-step, step)
+            self.state[property] = round(min(high, max(low, value)), 1)
+
+        return {
+            p.get_property_name(): self.state[p.get_property_name()]
+            for p in self._report_params
+        }
+
+    def create_action(self, rng: random.Random) -> Dict[str, Any]:
+        return {"action": rng.choice(self._actions)}
+
+    def _get_valid_value(self, param: NumericParameter, value: Any) -> Any:
+        if isinstance(param, ToggleParameter) and value == "TOGGLE":
+            return "OFF" if self.state.get(param.get_property_name()) == "ON" else "ON"
+
+        if isinstance(param, EnumParameter):
+            return (
+                value
+                if value in param._enum_values
+                else self.state.get(param.get_property_name())
+            )
+
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return min(param._max_value, max(param._min_value, value))
+
+        return value
+
+
+class FleetSimulator:
+    """
+    Answers the publishes of an :class:`InProcessMqttClientImpl` with the messages
+    zigbee2mqtt would send for the devices of ``devices``, and generates sensor and
+    remote traffic.
+
+    * Each ``/set`` and ``/get`` is answered with the full device state after
+      ``latency`` plus up to ``jitter`` seconds. A ``/set`` on a group updates and
+      echoes every member.
+    * Each answer and report is lost with a probability of ``loss``.
+    * Every sensor sends a report on average every ``1 / sensor_rate`` seconds, and
+      every remote an action every ``1 / remote_rate`` seconds. A rate of 0 disables
+      the traffic.
+
+    The answers are delivered in order of their due time by a single thread, so the
+    cost doesn't depend on the number of devices.
+    """
+
+    def __init__(
+        self,
+        impl: InProcessMqttClientImpl,
+        devices: DevicesClient,
+        base_topic: str = "zigbee2mqtt",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        sensor_rate: float = 0.0,
+        remote_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self._impl = impl
+        self._base_topic = base_topic
+        self._latency = latency
+        self._jitter = jitter
+        self._loss = loss
+        self._sensor_rate = sensor_rate
+        self._remote_rate = remote_rate
+        self._rng = random.Random(seed)
+
+        self._devices: Dict[str, VirtualDevice] = {}
+        self._ieee_addresses: Dict[str, str] = {}
+
+        for i, device in enumerate(devices.get_devices()):
+            virtual_device = VirtualDevice(device, self._rng)
+            self._devices[virtual_device.name] = virtual_device
+            self._ieee_addresses[virtual_device.name] = f"0x{i:016x}"
+
+        self._groups: Dict[str, List[VirtualDevice]] = {}
+
+        self._condition = threading.Condition()
+        self._queue: List[Tuple[float, int, Callable[[], None]]] = []
+        self._sequence_number = 0
+        self._in_flight = 0
+        self._thread: threading.Thread | None = None
+        self._should_stop = False
+
+        self.counters: Counter[str] = Counter()
+
+        impl.on_publish.add_listener(self._on_publish)
+
+    def add_groups(self, zigbee_groups: ZigbeeGroups) -> None:
+        """
+        Creates the zigbee2mqtt groups that ``zigbee_groups`` expects, with the same
+        members.
+        """
+        for group in zigbee_groups._groups:
+            self._groups[group.get_name()] = [
+                self._devices[member._get_topic()] for member in group._members
+            ]
+
+    def start(self) -> None:
+        """
+        Publishes the bridge topics and starts the traffic. Call this once the client
+        is connected.
+        """
+        self._deliver_now(
+            "bridge/devices",
+            [
+                {"friendly_name": name, "ieee_address": address}
+                for name, address in self._ieee_addresses.items()
+            ],
+        )
+        self._deliver_now(
+            "bridge/groups",
+            [
+                {
+                    "friendly_name": name,
+                    "members": [
+                        {"ieee_address": self._ieee_addresses[member.name]}
+                        for member in members
+                    ],
+                }
+                for name, members in self._groups.items()
+            ],
+        )
+
+        with self._condition:
+            for device in self._devices.values():
+                if device.is_sensor and self._sensor_rate > 0:
+                    self._schedule_report(
+                        device, device.create_report, self._sensor_rate
+                    )
+
+                if device.is_remote() and self._remote_rate > 0:
+                    self._schedule_report(
+                        device, device.create_action, self._remote_rate
+                    )
+
+        self._thread = threading.Thread(
+            target=self._run, name="fleet_simulator", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._should_stop = True
+            self._condition.notify()
+
+    def wait_until_settled(self, timeout: float = 60.0) -> bool:
+        """
+        Waits until all answers have been delivered and handled by the message loop,
+        including the answers to the messages those caused.
+
+        :return: False if this didn't happen within ``timeout`` seconds.
+        """
+        deadline = time.monotonic() + timeout
+
+        while time.monotonic() < deadline:
+            with self._condition:
+                while self._in_flight > 0:
+                    if not self._condition.wait(deadline - time.monotonic()):
+                        return False
+
+                received = self.counters["received"]
+
+            # The loop is FIFO, so everything injected so far has been handled once
+            # the marker runs
+            handled = threading.Event()
+            message_loop.post_message(handled.set)
+
+            if not handled.wait(max(0.0, deadline - time.monotonic())):
+                return False
+
+            with self._condition:
+                if self._in_flight == 0 and self.counters["received"] == received:
+                    return True
+
+        return False
+
+    def _on_publish(self, topic: str, payload: Dict[str, Any]) -> None:
+        prefix = self._base_topic + "/"
+
+        if not topic.startswith(prefix):
+            return
+
+        name, _, command = topic[len(prefix) :].rpartition("/")
+
+        with self._condition:
+            self.counters["received"] += 1
+
+            if command == "set" and name in self._groups:
+                self.counters["received_group_sets"] += 1
+
+                for device in self._groups[name]:
+                    device.apply_set(payload)
+                    self._schedule_answer(device)
+            elif command == "set" and name in self._devices:
+                self.counters["received_sets"] += 1
+                self._devices[name].apply_set(payload)
+                self._schedule_answer(self._devices[name])
+            elif command == "get" and name in self._devices:
+                self.counters["received_gets"] += 1
+                self._schedule_answer(self._devices[name])
+            else:
+                self.counters["received_unknown"] += 1
+
+    def _schedule_answer(self, device: VirtualDevice) -> None:
+        if self._rng.random() < self._loss:
+            self.counters["lost"] += 1
+            return
+
+        delay = self._latency + self._rng.uniform(0, self._jitter)
+        topic = f"{self._base_topic}/{device.name}"
+        payload = device.get_state_payload()
+        self._in_flight += 1
+        self._push(time.monotonic() + delay, lambda: self._deliver(topic, payload))
+
+    def _schedule_report(
+        self,
+        device: VirtualDevice,
+        create: Callable[[random.Random], Dict[str, Any]],
+        rate: float,
+    ) -> None:
+        topic = f"{self._base_topic}/{device.name}"
+
+        def report() -> None:
+            if self._rng.random() < self._loss:
+                self.counters["lost"] += 1
+            else:
+                self.counters["reports"] += 1
+                self._impl.inject(topic, create(self._rng))
+
+            self._push(time.monotonic() + self._rng.expovariate(rate), report)
+
+        self._push(time.monotonic() + self._rng.expovariate(rate), report)
+
+    def _push(self, due: float, callback: Callable[[], None]) -> None:
+        self._sequence_number += 1
+        heapq.heappush(self._queue, (due, self._sequence_number, callback))
+        self._condition.notify()
+
+    def _deliver(self, topic: str, payload: Dict[str, Any]) -> None:
+        self._in_flight -= 1
+        self.counters["answers"] += 1
+        self._impl.inject(topic, payload)
+
+        if self._in_flight == 0:
+            self._condition.notify_all()
+
+    def _deliver_now(self, topic: str, payload: Any) -> None:
+        self._impl.inject(f"{self._base_topic}/{topic}", payload)
+
+    def _run(self) -> None:
+        with self._condition:
+            while not self._should_stop:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+
+                delay = self._queue[0][0] - time.monotonic()
+
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                _, _, callback = heapq.heappop(self._queue)
+                callback()
+
+
+def add_simulated_devices(
+    client_type: Type[DevicesClient], counts: Dict[Type[Device], int]
+) -> Type[DevicesClient]:
+    """
+    :return: A subclass of ``client_type`` that also has ``counts[t]`` devices of
+             each type ``t``, called ``"sim <type> <index>"``.
+    """
+
+    class SimulatedDevices(client_type):  # type: ignore
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+
+            for device_type, count in counts.items():
+                for i in range(count):
+                    setattr(
+                        self,
+                        f"sim_{device_type.__name__.lower()}_{i}",
+                        device_type(f"sim {device_type.__name__} {i}"),
+                    )
+
+    return SimulatedDevices
+
+
+def _get_device_type_counts(
+    client_type: Type[DevicesClient], total: int, explicit: Sequence[str]
+) -> Dict[Type[Device], int]:
+    """
+    Distributes ``total`` devices over the device types of ``client_type`` in the
+    proportion they occur in it, and adds the ``Type=count`` items of ``explicit``.
+    """
+    module = sys.modules[client_type.__module__]
+    existing = Counter(type(d) for d in client_type().get_devices())
+    counts: Counter[Type[Device]] = Counter()
+
+    if total > 0:
+        device_count = sum(existing.values())
+
+        for device_type, count in existing.items():
+            counts[device_type] += round(total * count / device_count)
+
+    for item in explicit:
+        type_name, _, count_text = item.partition("=")
+        explicit_type = getattr(module, type_name, None)
+
+        if not isinstance(explicit_type, type) or not issubclass(explicit_type, Device):
+            raise ValueError(f"{type_name} is not a device type in {module.__name__}")
+
+        counts[explicit_type] += int(count_text)
+
+    return dict(counts)
+
+
+def _run_scenarios(
+    simulator: FleetSimulator,
+    scenarios: List[Tuple[str, Callable[[], None]]],
+    duration: float,
+    results: List[Dict[str, Any]],
+) -> None:
+    for name, action in scenarios:
+        before = Counter(simulator.counters)
+        start = time.perf_counter()
+        call_duration = 0.0
+        done = threading.Event()
+
+        def run() -> None:
+            nonlocal call_duration
+            call_start = time.perf_counter()
+            action()
+            call_duration = time.perf_counter() - call_start
+            done.set()
+
+        message_loop.post_message(run)
+        done.wait()
+
+        settled = simulator.wait_until_settled()
+        counters = simulator.counters - before
+
+        results.append(
+            {
+                "scenario": name,
+                "call_ms": call_duration * 1000,
+                "settle_ms": (time.perf_counter() - start) * 1000 if settled else None,
+                "messages_to_devices": counters["received"],
+                "group_messages": counters["received_group_sets"],
+                "answers": counters["answers"],
+                "lost": counters["lost"],
+            }
+        )
+
+    if duration > 0:
+        before = Counter(simulator.counters)
+        time.sleep(duration)
+        counters = simulator.counters - before
+
+        results.append(
+            {
+                "scenario": f"traffic for {duration:g} s",
+                "reports_per_second": counters["reports"] / duration,
+                "messages_to_devices": counters["received"],
+                "lost": counters["lost"],
+            }
+        )
+
+    simulator.stop()
+    message_loop.post_message(message_loop.stop)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Load test automation.py against a simulated zigbee2mqtt fleet"
+    )
+    parser.add_argument(
+        "--devices",
+        type=int,
+        default=0,
+        help="simulated devices to add, in the proportions of available_devices.py",
+    )
+    parser.add_argument(
+        "--device-type",
+        action="append",
+        default=[],
+        metavar="TYPE=COUNT",
+        help="simulated devices of a specific type to add, e.g. Innr_RB_279_T=500",
+    )
+    parser.add_argument("--latency", type=float, default=20, help="milliseconds")
+    parser.add_argument("--jitter", type=float, default=10, help="milliseconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="between 0 and 1")
+    parser.add_argument(
+        "--sensor-rate", type=float, default=1 / 60, help="reports/s per sensor"
+    )
+    parser.add_argument(
+        "--remote-rate", type=float, default=0.0, help="actions/s per remote"
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=10.0,
+        help="seconds of sensor and remote traffic after the scenarios",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import pyziggy_autogenerate.available_devices as available_devices
+
+    counts = _get_device_type_counts(
+        available_devices.AvailableDevices, args.devices, args.device_type
+    )
+
+    # automation.py creates its devices when it's imported, so the client class has
+    # to be replaced first
+    available_devices.AvailableDevices = add_simulated_devices(  # type: ignore
+        available_devices.AvailableDevices, counts
+    )
+
+    state_cache.enabled = False
+
+    import automation
+    from audio_cues import NullBackend, audio_cues
+
+    audio_cues._backend = NullBackend()
+    setattr(automation, "send_push_notification_to_home_group", lambda msg: None)
+    loop_monitor.install()
+
+    devices = automation.devices
+    impl = use_in_process_impl(devices)
+    applied_workarounds._apply(devices)
+
+    simulator = FleetSimulator(
+        impl,
+        devices,
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        loss=args.loss,
+        sensor_rate=args.sensor_rate,
+        remote_rate=args.remote_rate,
+        seed=args.seed,
+    )
+    simulator.add_groups(automation.zigbee_groups)
+
+    def change_mired() -> None:
+        # Makes every light that is on receive a write, as when the mired moves
+        for light in automation.lights_with_color_temp:
+            light.color_temp.mark_as_stale()
+
+        automation.change_mired()
+
+    results: List[Dict[str, Any]] = []
+    scenarios = [
+        ("startup query", lambda: None),
+        ("change_mired", change_mired),
+        ("turn_off_everything", automation.turn_off_everything),
+        ("turn_things_back_on", automation.turn_things_back_on),
+    ]
+
+    def on_connect() -> None:
+        simulator.start()
+        threading.Thread(
+            target=_run_scenarios,
+            args=(simulator, scenarios, args.duration, results),
+            daemon=True,
+        ).start()
+
+    devices.on_connect.add_listener(on_connect)
+
+    print(f"Simulating {len(devices.get_devices())} devices")
+    devices._connect("in-process", 0, 0, "zigbee2mqtt")
+    devices._loop_forever()
+
+    for result in results:
+        print(
+            "  ".join(
+                f"{k}={v:.1f}" if isinstance(v, float) else f"{k}={v}"
+                for k, v in result.items()
+            )
+        )
+
+    stats = loop_monitor.get_stats()
+    print(f"Message loop queue delay (ms): {stats['queue_delay_ms']}")
+    print(f"Message loop callback duration (ms): {stats['callback_duration_ms']}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -1,11 +1,17 @@
+import concurrent.futures
+import gzip
+import hashlib
 import json
+import logging
 import os
+import time
 from pathlib import Path
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Tuple
 
-from flask import Flask, request
+from flask import Flask, Response, request
 
 from automation import (
+    devices,
     turn_off_everything,
     turn_things_back_on,
     toggle_office,
@@ -13,8 +19,16 @@ from automation import (
 )
 from pyziggy.message_loop import message_loop
 
+import metrics
+from device_state import get_device_state_log
+from loop_monitor import loop_monitor
+
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
+device_state = get_device_state_log(devices)
+
 
 # Interprets the provided path constituents relative to the location of this
 # script, and returns an absolute Path to the resulting location.
@@ -30,21 +44,116 @@ def rel_to_py(*paths) -> Path:
 
 
 # ==============================================================================
+# The actions that can be sent to /pyziggy/post. The control page has one button
+# for each of them.
+commands: Dict[str, Callable[[], Any]] = {
+    "turn_off_all_lights": turn_off_everything,
+    "turn_things_back_on": turn_things_back_on,
+    "toggle_office": toggle_office,
+    "toggle_couch": toggle_couch,
+}
+
+
 def http_message_handler(payload):
     if "action" in payload:
-        action = payload["action"]
+        command = commands.get(payload["action"])
+
+        if command is not None:
+            command()
+
+
+def run_batch(actions: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Runs each action in order and returns the status and execution time of each.
+    Must be called on the message loop thread.
+    """
+    results: List[Dict[str, Any]] = []
+
+    for item in actions:
+        action = item.get("action") if isinstance(item, dict) else None
+        command = commands.get(action) if isinstance(action, str) else None
+        start = time.perf_counter()
+
+        if command is None:
+            status = "unknown_action"
+        else:
+            try:
+                command()
+                status = "ok"
+            except Exception:
+                logger.exception(f"Batch action {action} failed")
+                status = "error"
+
+        results.append(
+            {
+                "action": action,
+                "status": status,
+                "time_ms": (time.perf_counter() - start) * 1000,
+            }
+        )
+
+    return results
+
+
+def parse_batch_payload(payload: Any) -> Tuple[List[Any], float]:
+    """
+    :return: The actions and timeout of a ``/pyziggy/batch`` request.
+    :raises ValueError: If the payload is malformed.
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("actions"), list):
+        raise ValueError('Expected {"actions": [...]}')
+
+    timeout = payload.get("timeout", 5.0)
 
-        if action == "turn_off_all_lights":
-            turn_off_everything()
+    if not isinstance(timeout, (int, float)) or timeout <= 0:
+        raise ValueError("timeout must be a positive number")
 
-        if action == "turn_things_back_on":
-            turn_things_back_on()
+    return payload["actions"], min(float(timeout), 60.0)
 
-        if action == "toggle_office":
-            toggle_office()
 
-        if action == "toggle_couch":
-            toggle_couch()
+def post_batch(actions: List[Any]) -> concurrent.futures.Future:
+    """
+    Runs the actions in a single message loop callback. Can be called from any
+    thread.
+
+    :return: A future resolved with the results of :func:`run_batch`. Cancelling it
+             before the batch starts prevents the batch from running.
+    """
+    future: concurrent.futures.Future[List[Dict[str, Any]]] = (
+        concurrent.futures.Future()
+    )
+
+    def message_callback():
+        if not future.set_running_or_notify_cancel():
+            return
+
+        future.set_result(run_batch(actions))
+
+    message_loop.post_message(message_callback)
+
+    return future
+
+
+def post_batch_and_wait(
+    actions: List[Any], timeout: float
+) -> List[Dict[str, Any]] | None:
+    """
+    Posts the actions using :func:`post_batch` and waits for them to finish.
+
+    :return: The results of :func:`run_batch`, or None if the message loop didn't
+             get to the batch within ``timeout`` seconds. In that case the batch is
+             cancelled, unless it has already started.
+    """
+    future = post_batch(actions)
+
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        if future.cancel():
+            return None
+
+        # The batch started running just before the timeout
+        return future.result()
 
 
 # ==============================================================================
@@ -74,17 +183,83 @@ def make_html(description: str, commands: list[Dict[Any, Any]]):
     return result
 
 
+class CompiledPage:
+    """
+    The control page rendered to bytes, plus a gzip compressed variant. The page is
+    rendered again only if the template file's mtime or size changes.
+    """
+
+    def __init__(self, template_path: Path, render: Callable[[], str]):
+        self._template_path = template_path
+        self._render = render
+        self._template_signature: Tuple[int, int] | None = None
+        self.body = b""
+        self.gzip_body = b""
+        self.etag = ""
+
+    def update_if_necessary(self) -> None:
+        stat = self._template_path.stat()
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        if signature == self._template_signature:
+            return
+
+        self.body = self._render().encode("utf-8")
+        self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self._template_signature = signature
+
+    def get_response(
+        self, accepts_gzip: bool, if_none_match: Callable[[str], bool]
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        :param if_none_match: Returns True if the request's If-None-Match header
+                              contains the ETag passed to it.
+        :return: The status, headers and body of the response.
+        """
+        self.update_if_necessary()
+
+        # The two encodings are different representations, so they need different
+        # strong ETags
+        if accepts_gzip:
+            body, etag = self.gzip_body, self.etag + "-gzip"
+        else:
+            body, etag = self.body, self.etag
+
+        headers = {
+            "ETag": f'"{etag}"',
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+
+        if if_none_match(etag):
+            return 304, headers, b""
+
+        if accepts_gzip:
+            headers["Content-Encoding"] = "gzip"
+
+        headers["Content-Type"] = "text/html; charset=utf-8"
+
+        return 200, headers, body
+
+
+control_page = CompiledPage(
+    rel_to_py("http_interface_html_template.html"),
+    lambda: make_html(
+        "Send commands to <code>/pyziggy/post</code>.",
+        [{"action": action} for action in commands],
+    ),
+)
+control_page.update_if_necessary()
+
+
 @app.route("/pyziggy")
 def http_pyziggy_help():
-    commands = [
-        {"action": "turn_off_all_lights"},
-        {"action": "turn_things_back_on"},
-        {"action": "toggle_office"},
-        {"action": "toggle_couch"},
-    ]
+    status, headers, body = control_page.get_response(
+        request.accept_encodings.quality("gzip") > 0, request.if_none_match.contains
+    )
 
-    html = make_html("Send commands to <code>/pyziggy/post</code>.", commands)
-    return html, 200
+    return Response(body, status, headers)
 
 
 @app.route("/pyziggy/post", methods=["POST"])
@@ -97,3 +272,54 @@ def http_pyziggy_post():
     message_loop.post_message(message_callback)
 
     return "", 200
+
+
+@app.route("/pyziggy/batch", methods=["POST"])
+def http_pyziggy_batch():
+    """
+    Accepts ``{"actions": [{"action": ...}, ...], "timeout": seconds}`` and responds
+    once all actions have run, with the status and execution time of each.
+    """
+    try:
+        actions, timeout = parse_batch_payload(request.get_json(silent=True))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    start = time.perf_counter()
+    results = post_batch_and_wait(actions, timeout)
+
+    if results is None:
+        return {"error": "Timed out waiting for the message loop"}, 504
+
+    return {"results": results, "time_ms": (time.perf_counter() - start) * 1000}, 200
+
+
+@app.route("/pyziggy/state")
+def http_pyziggy_state():
+    return Response(device_state.get_state_json(), 200, mimetype="application/json")
+
+
+@app.route("/pyziggy/state/<device>")
+def http_pyziggy_device_state(device: str):
+    state = device_state.get_device_json(device)
+
+    if state is None:
+        return {"error": f"No device called {device}"}, 404
+
+    return Response(state, 200, mimetype="application/json")
+
+
+@app.route("/metrics")
+def http_metrics():
+    if not metrics.enabled:
+        return "Metrics are disabled in config.toml\n", 404
+
+    return Response(metrics.render_prometheus(), 200, content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/pyziggy/loop")
+def http_pyziggy_loop():
+    if not loop_monitor.is_installed():
+        return {"error": "The loop monitor isn't installed, see config.toml"}, 404
+
+    return loop_monitor.get_stats(), 200
@@ -0,0 +1,91 @@
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from pyziggy.broadcasters import AnyBroadcaster
+from pyziggy.message_loop import message_loop
+from pyziggy.mqtt_client import MqttClient, MqttClientImpl
+
+
+class InProcessMqttClientImpl(MqttClientImpl):
+    """
+    An :class:`MqttClientImpl` that connects to nothing. Inbound messages are
+    delivered with :meth:`inject` instead of coming from a broker, and every publish
+    is passed to the ``on_publish`` listeners as ``(topic, payload)``.
+
+    Like the paho based implementation, the client's callbacks are always called on
+    the message thread, so :meth:`inject` can be called from any thread.
+    """
+
+    def __init__(self):
+        self._on_connect_callback: Callable[[int], None] | None = None
+        self._on_message_callback: Callable[[str, Dict[str, Any]], None] | None = None
+        self._on_connect_was_called = False
+
+        self.subscriptions: List[str] = []
+        self.on_publish = AnyBroadcaster()
+
+    def connect(
+        self,
+        host: str,
+        port: int,
+        keepalive: int,
+        username: str | None = None,
+        password: str | None = None,
+        ca_crt: Path | None = None,
+        client_crt: Path | None = None,
+        client_key: Path | None = None,
+        check_server_crt: bool = False,
+    ):
+        message_loop.post_message(self._call_on_connect)
+
+    def was_on_connect_called(self) -> bool:
+        return self._on_connect_was_called
+
+    def set_on_connect(self, callback):
+        self._on_connect_callback = callback
+
+    def set_on_message(self, callback):
+        self._on_message_callback = callback
+
+    def subscribe(self, topic: str):
+        self.subscriptions.append(topic)
+
+    def publish(self, topic: str, payload: Dict[str, Any]):
+        # Round tripping through JSON hands listeners what a broker would deliver,
+        # and catches payloads that the paho implementation couldn't send
+        wire_payload = json.loads(json.dumps(payload))
+        self.on_publish._call_listeners(lambda cb: cb(topic, wire_payload))
+
+    def loop_forever(self) -> int:
+        return message_loop.run()
+
+    def inject(self, topic: str, payload: Dict[str, Any]) -> None:
+        """
+        Delivers a message to the client as if it had arrived from the broker. Can be
+        called from any thread.
+        """
+        message_loop.post_message(lambda: self._call_on_message(topic, payload))
+
+    def _call_on_connect(self) -> None:
+        self._on_connect_was_called = True
+
+        if self._on_connect_callback is not None:
+            self._on_connect_callback(0)
+
+    def _call_on_message(self, topic: str, payload: Dict[str, Any]) -> None:
+        if self._on_message_callback is not None:
+            self._on_message_callback(topic, payload)
+
+
+def use_in_process_impl(client: MqttClient) -> InProcessMqttClientImpl:
+    """
+    Replaces the implementation of a client that hasn't connected yet with an
+    :class:`InProcessMqttClientImpl`. This is for clients that are created at import
+    time, like the ``devices`` object in :mod:`automation`.
+    """
+    impl = InProcessMqttClientImpl()
+    client._impl = impl
+    impl.set_on_connect(client._on_connect)
+    impl.set_on_message(client._on_message)
+    return impl
@@ -0,0 +1,243 @@
+import importlib.metadata
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+from pyziggy.message_loop import MessageLoopTimer, message_loop
+
+from project_config import get_config_section
+
+logger = logging.getLogger(__name__)
+
+# LoopMonitor.install() replaces message_loop.post_message and
+# MessageLoopTimer._timer_callback, and reads private fields of MessageLoopTimer.
+# None of these are public API, so the monitor only installs itself with the pyziggy
+# versions it was checked against. Check the patched code before adding a version.
+_SUPPORTED_PYZIGGY_VERSIONS = ("0.9.3",)
+
+
+def _get_pyziggy_version() -> str | None:
+    try:
+        return importlib.metadata.version("pyziggy")
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def _get_callback_name(callback: Any) -> str:
+    name = getattr(callback, "__qualname__", None) or type(callback).__qualname__
+    module = getattr(callback, "__module__", None)
+    return f"{module}.{name}" if module else name
+
+
+def get_percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+
+    values = sorted(values)
+
+    def percentile(p: float) -> float:
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+    return {
+        "p50": percentile(0.5),
+        "p90": percentile(0.9),
+        "p99": percentile(0.99),
+        "max": values[-1],
+        "count": len(values),
+    }
+
+
+class LoopMonitor:
+    """
+    Measures how backed up the message loop is.
+
+    * The queueing delay of each ``post_message`` callback, i.e. the time between
+      posting it and the loop starting to run it, and the time the callback took.
+    * The drift of each :class:`MessageLoopTimer`, i.e. how late its callback ran
+      compared to when it was due.
+
+    The last ``window`` measurements of each kind are kept for rolling percentiles.
+    If a callback waited longer than ``warning_threshold`` seconds, a warning listing
+    the slowest recent callbacks is logged, at most once per ``warning_interval``.
+
+    Measuring relies on pyziggy internals, see :meth:`install`.
+    """
+
+    def __init__(
+        self,
+        window: int = 1024,
+        warning_threshold: float = 0.25,
+        warning_interval: float = 10.0,
+    ):
+        self._window = window
+        self._warning_threshold = warning_threshold
+        self._warning_interval = warning_interval
+        self._last_warning = -warning_interval
+        self._lock = threading.Lock()
+        self._installed = False
+
+        self._queue_delays: Deque[float] = deque(maxlen=window)
+        self._durations: Deque[Tuple[float, str]] = deque(maxlen=window)
+        self._timer_drifts: Dict[str, Deque[float]] = {}
+        self._timer_periods: Dict[str, float] = {}
+        self._recorded_durations: List[float] | None = None
+
+    def install(self) -> None:
+        """
+        Starts measuring by wrapping ``message_loop.post_message`` and the callbacks
+        of all MessageLoopTimers. Does nothing, apart from logging a warning, if the
+        installed pyziggy version isn't one of ``_SUPPORTED_PYZIGGY_VERSIONS``.
+        """
+        if self._installed:
+            return
+
+        version = _get_pyziggy_version()
+
+        if version not in _SUPPORTED_PYZIGGY_VERSIONS:
+            logger.warning(
+                f"The loop monitor isn't installed, because it only supports pyziggy"
+                f" {', '.join(_SUPPORTED_PYZIGGY_VERSIONS)}, not {version}"
+            )
+            return
+
+        # Everything below patches or reads pyziggy internals
+        self._installed = True
+        post_message = message_loop.post_message
+        monitor = self
+
+        def monitored_post_message(message: Callable[[], None]) -> None:
+            posted_at = time.perf_counter()
+            post_message(lambda: monitor._run_message(message, posted_at))
+
+        message_loop.post_message = monitored_post_message  # type: ignore
+
+        timer_callback = MessageLoopTimer._timer_callback
+
+        def monitored_timer_callback(timer: MessageLoopTimer) -> None:
+            if not timer._should_stop:
+                monitor._record_timer_drift(timer)
+
+            timer_callback(timer)
+
+        MessageLoopTimer._timer_callback = monitored_timer_callback  # type: ignore
+
+    def is_installed(self) -> bool:
+        return self._installed
+
+    def start_recording(self) -> None:
+        """
+        Keeps the duration of every callback from now on, not only the last
+        ``window`` ones, until :meth:`stop_recording` is called.
+        """
+        with self._lock:
+            self._recorded_durations = []
+
+    def stop_recording(self) -> List[float]:
+        """
+        :return: The durations of all callbacks since :meth:`start_recording` in
+                 seconds.
+        """
+        with self._lock:
+            durations = self._recorded_durations or []
+            self._recorded_durations = None
+
+        return durations
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        :return: Rolling percentiles of the measurements in milliseconds, and the
+                 slowest recent callbacks.
+        """
+        with self._lock:
+            queue_delays = list(self._queue_delays)
+            durations = list(self._durations)
+            timer_drifts = {
+                name: list(drifts) for name, drifts in self._timer_drifts.items()
+            }
+
+        def to_ms(values: List[float]) -> List[float]:
+            return [v * 1000 for v in values]
+
+        return {
+            "queue_delay_ms": get_percentiles(to_ms(queue_delays)),
+            "callback_duration_ms": get_percentiles(to_ms([d for d, _ in durations])),
+            "slowest_callbacks": self._get_slowest_callbacks(durations),
+            "timer_drift_ms": {
+                name: {
+                    "period_ms": self._timer_periods[name] * 1000,
+                    **get_percentiles(to_ms(drifts)),
+                }
+                for name, drifts in timer_drifts.items()
+            },
+        }
+
+    @staticmethod
+    def _get_slowest_callbacks(
+        durations: List[Tuple[float, str]], count: int = 5
+    ) -> List[Dict[str, Any]]:
+        return [
+            {"callback": name, "duration_ms": duration * 1000}
+            for duration, name in sorted(durations, reverse=True)[:count]
+        ]
+
+    def _run_message(self, message: Callable[[], None], posted_at: float) -> None:
+        start = time.perf_counter()
+
+        try:
+            message()
+        finally:
+            duration = time.perf_counter() - start
+            queue_delay = start - posted_at
+
+            with self._lock:
+                self._queue_delays.append(queue_delay)
+                self._durations.append((duration, _get_callback_name(message)))
+
+                if self._recorded_durations is not None:
+                    self._recorded_durations.append(duration)
+
+            if queue_delay > self._warning_threshold:
+                self._warn(queue_delay)
+
+    def _record_timer_drift(self, timer: MessageLoopTimer) -> None:
+        name = _get_callback_name(timer._callback)
+
+        # The loop advances _wait_time right before calling the timers that are due,
+        # so a negative value is how late the timer is
+        drift = max(0.0, -timer._wait_time)
+
+        with self._lock:
+            if name not in self._timer_drifts:
+                self._timer_drifts[name] = deque(maxlen=self._window)
+
+            self._timer_drifts[name].append(drift)
+            self._timer_periods[name] = timer._duration
+
+    def _warn(self, queue_delay: float) -> None:
+        now = time.monotonic()
+
+        if now - self._last_warning < self._warning_interval:
+            return
+
+        self._last_warning = now
+
+        with self._lock:
+            slowest = self._get_slowest_callbacks(list(self._durations))
+
+        logger.warning(
+            f"The message loop is lagging: a callback waited {queue_delay * 1000:.0f}"
+            " ms before running. Slowest recent callbacks: "
+            + ", ".join(f"{c['callback']} ({c['duration_ms']:.1f} ms)" for c in slowest)
+        )
+
+
+_config = get_config_section("loop_monitor")
+
+loop_monitor = LoopMonitor(
+    warning_threshold=_config.get("warning_threshold_ms", 250) / 1000
+)
+
+if _config.get("enabled", False):
+    loop_monitor.install()
@@ -1,2 +1,20 @@
+from pyziggy.message_loop import message_loop
+
 from automation import devices
-from http_interface import app
+from project_config import get_config_section
+
+http_config = get_config_section("flask")
+
+# pyziggy serves any Flask object it finds in this module, so the app is only
+# imported here when it's the selected front end
+if http_config.get("frontend", "flask") == "asyncio":
+    from async_http_interface import AsyncHttpServer
+
+    http_server = AsyncHttpServer(
+        port=http_config.get("flask_port", 5001),
+        max_concurrent_requests=http_config.get("max_concurrent_requests", 64),
+    )
+    http_server.start()
+    message_loop.on_stop.add_listener(http_server.stop)
+else:
+    from http_interface import app
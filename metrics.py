@@ -0,0 +1,148 @@
+import functools
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, TypeVar
+
+from pyziggy.devices_client import DevicesClient
+
+from project_config import get_config_section
+
+# Set in the [metrics] section of config.toml. When False, instrument() returns the
+# callbacks unchanged, so there is no overhead at all.
+enabled: bool = bool(get_config_section("metrics").get("enabled", False))
+
+# Upper bounds of the latency histogram buckets in seconds
+BUCKETS = [
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+]
+
+
+class Histogram:
+    """
+    Counts observations in the fixed :data:`BUCKETS`. An observation costs a binary
+    search and two additions.
+    """
+
+    def __init__(self):
+        # The last element counts the observations above the largest bucket
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+listener_durations: Dict[str, Histogram] = {}
+device_publishes: Dict[str, int] = {}
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def instrument(name: str, callback: F) -> F:
+    """
+    Returns a wrapper around the callback that records the number and duration of
+    calls under ``name``. If metrics are disabled the callback is returned as is.
+
+    Example::
+
+        devices.tv.current.add_listener(instrument("tv_current", on_current))
+    """
+    if not enabled:
+        return callback
+
+    histogram = listener_durations.setdefault(name, Histogram())
+
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper  # type: ignore
+
+
+def count_publishes(devices: DevicesClient) -> None:
+    """
+    Counts the MQTT messages sent to each device. Does nothing if metrics are
+    disabled.
+    """
+    if not enabled:
+        return
+
+    for device in devices.get_devices():
+        name = device._get_topic()
+        device_publishes[name] = 0
+
+        def publish(payload, name=name, publish=device.publish):
+            device_publishes[name] += 1
+            publish(payload)
+
+        device.publish = publish  # type: ignore
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    """
+    :return: All metrics in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP pyziggy_listener_duration_seconds Time spent in listener callbacks.",
+        "# TYPE pyziggy_listener_duration_seconds histogram",
+    ]
+
+    for name, histogram in list(listener_durations.items()):
+        label = f'listener="{_escape_label(name)}"'
+        cumulative = 0
+
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(
+                f'pyziggy_listener_duration_seconds_bucket{{{label},le="{bound}"}}'
+                f" {cumulative}"
+            )
+
+        lines.append(
+            f'pyziggy_listener_duration_seconds_bucket{{{label},le="+Inf"}}'
+            f" {histogram.count}"
+        )
+        lines.append(
+            f"pyziggy_listener_duration_seconds_sum{{{label}}} {histogram.sum}"
+        )
+        lines.append(
+            f"pyziggy_listener_duration_seconds_count{{{label}}} {histogram.count}"
+        )
+
+    lines += [
+        "# HELP pyziggy_device_publishes_total MQTT messages sent to each device.",
+        "# TYPE pyziggy_device_publishes_total counter",
+    ]
+
+    for name, count in list(device_publishes.items()):
+        lines.append(
+            f'pyziggy_device_publishes_total{{device="{_escape_label(name)}"}} {count}'
+        )
+
+    return "\n".join(lines) + "\n"
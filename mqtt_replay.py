@@ -0,0 +1,321 @@
+"""
+Replays a recorded zigbee2mqtt message log through the automation in
+:mod:`automation`, without a broker or any devices, and reports how fast the
+messages were processed and what the automation published in response.
+
+A log has one message per line, either as a JSON object::
+
+    {"time": 1700000000.25, "topic": "zigbee2mqtt/office_remote", "payload": {...}}
+
+or as ``<unix time> <topic> <JSON payload>``, which is what the following command
+records::
+
+    mosquitto_sub -h <broker> -v -F '%U %t %p' -t 'zigbee2mqtt/#' > traffic.log
+
+Usage::
+
+    python mqtt_replay.py traffic.log                # as fast as possible
+    python mqtt_replay.py traffic.log --speed 1      # wall clock
+    python mqtt_replay.py traffic.log --speed 10     # ten times faster
+    python mqtt_replay.py traffic.log --json report.json
+
+The processing cost is measured with the loop monitor of :mod:`loop_monitor`, for
+every message loop callback that runs from the start of the replay until the end
+of the settle time. This includes the listeners and timers that the inbound
+messages cause, which mostly run in callbacks posted after the message itself was
+handled. The inbound message rate is the number of messages divided by that busy
+time.
+
+Push notifications and audio cues are suppressed during the replay.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Tuple
+
+from pyziggy.message_loop import message_loop
+from pyziggy.workarounds import applied_workarounds
+
+from audio_cues import NullBackend, audio_cues
+from in_process_mqtt import use_in_process_impl
+from loop_monitor import get_percentiles, loop_monitor
+import state_cache
+
+logger = logging.getLogger(__name__)
+
+_Message = Tuple[float, str, Dict[str, Any]]
+
+
+def parse_log_line(line: str) -> _Message | None:
+    """
+    :return: The timestamp, topic and payload of a log line, or None for empty
+             lines. Raises ValueError for lines that can't be parsed.
+    """
+    line = line.strip()
+
+    if not line:
+        return None
+
+    if line.startswith("{"):
+        entry = json.loads(line)
+        return float(entry["time"]), entry["topic"], entry["payload"]
+
+    # Friendly names, and so topics, can contain spaces, but payloads are objects
+    timestamp, rest = line.split(" ", 1)
+    topic, payload = rest.split(" {", 1)
+    parsed_payload = json.loads("{" + payload)
+
+    if not isinstance(parsed_payload, dict):
+        raise ValueError(f"The payload is not a JSON object: {payload}")
+
+    return float(timestamp), topic, parsed_payload
+
+
+def load_log(path: Path) -> List[_Message]:
+    messages: List[_Message] = []
+    skipped = 0
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            try:
+                message = parse_log_line(line)
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping line {line_number} of {path}: {e}")
+                skipped += 1
+                continue
+
+            if message is not None:
+                messages.append(message)
+
+    if skipped:
+        print(f"Skipped {skipped} lines that couldn't be parsed")
+
+    return messages
+
+
+class TrafficReplay:
+    """
+    Feeds messages into the ``devices`` of :mod:`automation` through an
+    :class:`InProcessMqttClientImpl`, and records the outbound publishes.
+
+    ``speed`` is the factor by which the recorded time between messages is shortened,
+    1 replays at wall clock speed, and 0 sends each message as soon as possible.
+    """
+
+    def __init__(
+        self,
+        messages: List[_Message],
+        speed: float = 0.0,
+        settle_time: float = 1.0,
+        startup_query: bool = False,
+    ):
+        self._messages = messages
+        self._speed = speed
+        self._settle_time = settle_time
+
+        # Imported here, so that the replay doesn't restore or overwrite the state
+        # cache of the real installation
+        state_cache.enabled = False
+        import automation
+
+        self._devices = automation.devices
+        self._impl = use_in_process_impl(self._devices)
+        self._impl.set_on_message(self._on_message)
+        self._impl.on_publish.add_listener(self._on_publish)
+
+        audio_cues._backend = NullBackend()
+        self.notifications: List[str] = []
+        setattr(
+            automation,
+            "send_push_notification_to_home_group",
+            self.notifications.append,
+        )
+
+        applied_workarounds._apply(self._devices)
+        self._devices._set_skip_initial_query(not startup_query)
+
+        self._connected = threading.Event()
+        self._devices.on_connect.add_listener(self._connected.set)
+
+        # The listeners that react to a message mostly run in callbacks posted by
+        # the message's handler, so the durations of all callbacks are measured
+        loop_monitor.install()
+
+        self._inject_times: Deque[float] = deque()
+        self._queue_delays: List[float] = []
+        self._callback_durations: List[float] | None = None
+        self._inbound_messages = 0
+
+        self._replaying = False
+        self.outbound: Counter[str] = Counter()
+        self.outbound_during_startup = 0
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Replays all messages, waits ``settle_time`` seconds for delayed reactions,
+        and returns the report.
+        """
+        feeder = threading.Thread(target=self._feed, name="mqtt_replay", daemon=True)
+        feeder.start()
+
+        self._devices._connect("in-process", 0, 0, "zigbee2mqtt")
+        self._devices._loop_forever()
+        feeder.join()
+
+        if loop_monitor.is_installed():
+            self._callback_durations = loop_monitor.stop_recording()
+
+        return self.get_report()
+
+    def get_report(self) -> Dict[str, Any]:
+        def to_ms(values: List[float]) -> List[float]:
+            return [v * 1000 for v in values]
+
+        durations = self._callback_durations
+        busy_time = sum(durations) if durations is not None else None
+        inbound = self._inbound_messages
+
+        return {
+            "inbound_messages": inbound,
+            "inbound_messages_per_second": (
+                inbound / busy_time if inbound and busy_time else None
+            ),
+            "busy_time_per_message_ms": (
+                busy_time / inbound * 1000 if inbound and busy_time else None
+            ),
+            "callback_duration_ms": (
+                get_percentiles(to_ms(durations)) if durations is not None else {}
+            ),
+            "queue_delay_ms": get_percentiles(to_ms(self._queue_delays)),
+            "outbound_messages": sum(self.outbound.values()),
+            "outbound_messages_during_startup": self.outbound_during_startup,
+            "outbound_messages_by_topic": dict(self.outbound.most_common()),
+            "push_notifications": len(self.notifications),
+        }
+
+    def _feed(self) -> None:
+        self._connected.wait()
+
+        # Lets the startup publishes be told apart from the replay's
+        message_loop.post_message(self._start_replaying)
+
+        if self._messages:
+            first_timestamp = self._messages[0][0]
+            start = time.perf_counter()
+
+            for timestamp, topic, payload in self._messages:
+                if self._speed > 0:
+                    due = start + (timestamp - first_timestamp) / self._speed
+                    delay = due - time.perf_counter()
+
+                    if delay > 0:
+                        time.sleep(delay)
+
+                self._inject_times.append(time.perf_counter())
+                self._impl.inject(topic, payload)
+
+        time.sleep(self._settle_time)
+        message_loop.post_message(message_loop.stop)
+
+    def _start_replaying(self) -> None:
+        self._replaying = True
+
+        if loop_monitor.is_installed():
+            loop_monitor.start_recording()
+
+    def _on_message(self, topic: str, payload: Dict[str, Any]) -> None:
+        self._queue_delays.append(time.perf_counter() - self._inject_times.popleft())
+        self._inbound_messages += 1
+        self._devices._on_message(topic, payload)
+
+    def _on_publish(self, topic: str, payload: Dict[str, Any]) -> None:
+        if self._replaying:
+            self.outbound[topic] += 1
+        else:
+            self.outbound_during_startup += 1
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    def format_percentiles(percentiles: Dict[str, float]) -> str:
+        if not percentiles:
+            return "-"
+
+        return "  ".join(
+            f"{key} {percentiles[key]:.3f}" for key in ("p50", "p90", "p99", "max")
+        )
+
+    rate = report["inbound_messages_per_second"]
+    busy_time = report["busy_time_per_message_ms"]
+
+    print(f"Inbound messages:        {report['inbound_messages']}")
+    print(
+        f"Inbound messages/s:      {rate:.0f}" if rate else "Inbound messages/s:      -"
+    )
+    print(
+        f"Busy time/message (ms):  {busy_time:.3f}"
+        if busy_time
+        else "Busy time/message (ms):  -"
+    )
+    print(
+        f"Callback duration (ms):  {format_percentiles(report['callback_duration_ms'])}"
+    )
+    print(f"Queue delay (ms):        {format_percentiles(report['queue_delay_ms'])}")
+    print(f"Outbound messages:       {report['outbound_messages']}")
+    print(f"  during startup:        {report['outbound_messages_during_startup']}")
+    print(f"Push notifications:      {report['push_notifications']}")
+
+    for topic, count in report["outbound_messages_by_topic"].items():
+        print(f"  {count:8d}  {topic}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded zigbee2mqtt message log through automation.py"
+    )
+    parser.add_argument("log", type=Path, help="the message log to replay")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="1 replays at wall clock speed, 10 ten times faster, 0 (the default)"
+        " as fast as possible",
+    )
+    parser.add_argument(
+        "--settle-time",
+        type=float,
+        default=1.0,
+        help="seconds to wait for delayed reactions after the last message",
+    )
+    parser.add_argument(
+        "--startup-query",
+        action="store_true",
+        help="query all devices on connect like pyziggy run does",
+    )
+    parser.add_argument("--json", type=Path, help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.speed < 0:
+        parser.error("--speed can't be negative")
+
+    messages = load_log(args.log)
+    report = TrafficReplay(
+        messages, args.speed, args.settle_time, args.startup_query
+    ).run()
+    print_report(report)
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import os
+import tomllib
+from pathlib import Path
+from typing import Any, Dict
+
+
+def _rel_to_py(*paths) -> Path:
+    return Path(
+        os.path.realpath(
+            os.path.join(os.path.realpath(os.path.dirname(__file__)), *paths)
+        )
+    )
+
+
+def get_config_section(name: str) -> Dict[str, Any]:
+    """
+    Returns a section of the project's ``config.toml``, the same file that
+    ``pyziggy run`` reads. Returns an empty dictionary if the file or the section
+    doesn't exist.
+    """
+    config_path = _rel_to_py("config.toml")
+
+    if not config_path.exists():
+        return {}
+
+    with open(config_path, "rb") as f:
+        section = tomllib.load(f).get(name, {})
+
+    return section if isinstance(section, dict) else {}
@@ -1,31 +1,199 @@
-import http.client, urllib
+import http.client
+import logging
+import queue
+import threading
+import time
+import urllib.parse
+from typing import Dict
 
 from secrets import get_secret_or_else
 
+logger = logging.getLogger(__name__)
 
-def send_push_notification_to_home_group(msg: str) -> None:
-    """Send a push notification to the home automation group via Pushover."""
-
-    APP_TOKEN = get_secret_or_else("pushover_app_token", "")
-    HOME_AUTOMATION_GROUP_KEY = get_secret_or_else(
-        "pushover_home_automation_group_key", ""
-    )
-
-    if not APP_TOKEN or not HOME_AUTOMATION_GROUP_KEY:
-        return
-
-    conn = http.client.HTTPSConnection("api.pushover.net:443")
-    conn.request(
-        "POST",
-        "/1/messages.json",
-        urllib.parse.urlencode(
-            {
-                "token": APP_TOKEN,
-                "user": HOME_AUTOMATION_GROUP_KEY,
-                "message": msg,
+
+class PushoverDispatcher:
+    """
+    Sends Pushover notifications on a background thread, so that callers on the
+    message loop thread only ever enqueue a message.
+
+    A single keep-alive connection is reused between messages. Failed requests are
+    retried with exponential backoff, identical messages sent within
+    ``dedup_window`` seconds of each other are dropped, and messages are dropped if
+    more than ``max_queue_size`` are waiting.
+
+    The credentials are read from the secrets when a message is sent, unless they are
+    passed in. ``host``, ``port`` and ``use_https`` allow sending to a stand-in server
+    instead of Pushover.
+    """
+
+    HOST = "api.pushover.net"
+    PATH = "/1/messages.json"
+
+    def __init__(
+        self,
+        host: str = HOST,
+        port: int = 443,
+        use_https: bool = True,
+        app_token: str | None = None,
+        group_key: str | None = None,
+        max_queue_size: int = 32,
+        dedup_window: float = 10.0,
+        max_attempts: int = 4,
+        initial_backoff: float = 1.0,
+        timeout: float = 10.0,
+    ):
+        self._host = host
+        self._port = port
+        self._use_https = use_https
+        self._app_token = app_token
+        self._group_key = group_key
+        self._queue: queue.Queue[str] = queue.Queue(max_queue_size)
+        self._dedup_window = dedup_window
+        self._max_attempts = max_attempts
+        self._initial_backoff = initial_backoff
+        self._timeout = timeout
+
+        self._last_enqueued: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._connection: http.client.HTTPConnection | None = None
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def send(self, msg: str) -> bool:
+        """
+        Enqueues a message without blocking.
+
+        :return: False if the message was dropped as a duplicate or because the queue
+                 is full.
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            self._last_enqueued = {
+                m: t
+                for m, t in self._last_enqueued.items()
+                if now - t < self._dedup_window
             }
-        ),
-        {"Content-type": "application/x-www-form-urlencoded"},
-    )
-    conn.getresponse()
 
+            if msg in self._last_enqueued:
+                self.dropped += 1
+                return False
+
+            try:
+                self._queue.put_nowait(msg)
+            except queue.Full:
+                self.dropped += 1
+                logger.warning(f'Notification queue is full, dropping "{msg}"')
+                return False
+
+            self._last_enqueued[msg] = now
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="pushover", daemon=True
+                )
+                self._thread.start()
+
+        return True
+
+    def _run(self) -> None:
+        while True:
+            msg = self._queue.get()
+
+            try:
+                self._send_with_retries(msg)
+            except Exception:
+                logger.exception("Unexpected error while sending a notification")
+            finally:
+                self._queue.task_done()
+
+    def _send_with_retries(self, msg: str) -> None:
+        app_token = self._app_token
+        group_key = self._group_key
+
+        if app_token is None:
+            app_token = get_secret_or_else("pushover_app_token", "")
+
+        if group_key is None:
+            group_key = get_secret_or_else("pushover_home_automation_group_key", "")
+
+        if not app_token or not group_key:
+            return
+
+        body = urllib.parse.urlencode(
+            {"token": app_token, "user": group_key, "message": msg}
+        )
+        backoff = self._initial_backoff
+
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                status = self._post(body)
+            except (OSError, http.client.HTTPException) as e:
+                self._close_connection()
+                error = repr(e)
+            else:
+                # Other 4xx responses mean that the request itself is invalid, so
+                # there is no point retrying it
+                if status < 500 and status != 429:
+                    if status < 400:
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+                        logger.warning(f"Pushover rejected a notification: {status}")
+
+                    return
+
+                error = f"HTTP {status}"
+
+            if attempt < self._max_attempts:
+                logger.info(f"Sending notification failed ({error}), retrying")
+                time.sleep(backoff)
+                backoff *= 2
+
+        self.failed += 1
+        logger.warning(f'Giving up sending notification "{msg}": {error}')
+
+    def _post(self, body: str) -> int:
+        if self._connection is None:
+            connection_type = (
+                http.client.HTTPSConnection
+                if self._use_https
+                else http.client.HTTPConnection
+            )
+            self._connection = connection_type(
+                self._host, self._port, timeout=self._timeout
+            )
+
+        self._connection.request(
+            "POST",
+            PushoverDispatcher.PATH,
+            body,
+            {"Content-type": "application/x-www-form-urlencoded"},
+        )
+        response = self._connection.getresponse()
+        response.read()
+
+        if response.will_close:
+            self._close_connection()
+
+        return response.status
+
+    def _close_connection(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+_dispatcher = PushoverDispatcher()
+
+
+def send_push_notification_to_home_group(msg: str) -> None:
+    """
+    Send a push notification to the home automation group via Pushover. The
+    notification is sent on a background thread, so this function doesn't block.
+    """
+
+    _dispatcher.send(msg)
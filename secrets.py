@@ -1,26 +1,80 @@
 import json
 import os
+import threading
+import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Dict, Tuple
 
 
-def get_secret_or_else(key: str, default: Any) -> Any:
-    def rel_to_py(*paths) -> Path:
-        return Path(
-            os.path.realpath(
-                os.path.join(os.path.realpath(os.path.dirname(__file__)), *paths)
-            )
+def _rel_to_py(*paths) -> Path:
+    return Path(
+        os.path.realpath(
+            os.path.join(os.path.realpath(os.path.dirname(__file__)), *paths)
         )
+    )
+
+
+class SecretsStore:
+    """
+    Serves secrets from a parsed copy of a JSON file. The file is parsed again only
+    if its mtime or size changed, and these are checked at most once every
+    ``check_interval`` seconds.
+
+    Lookups are thread safe.
+    """
+
+    def __init__(self, path: Path, check_interval: float = 5.0):
+        self._path = path
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {}
+        self._file_signature: Tuple[int, int] | None = None
+        self._next_check: float | None = None
+
+    def get(self, key: str, default: Any) -> Any:
+        with self._lock:
+            now = time.monotonic()
+
+            if self._next_check is None or now >= self._next_check:
+                self._next_check = now + self._check_interval
+                self._reload_if_changed()
+
+            return self._data.get(key, default)
 
-    secrets_path = rel_to_py("secrets", "secrets.json")
+    def reload(self) -> None:
+        """
+        Parses the file again on the next lookup, regardless of the check interval
+        and whether the file changed.
+        """
+        with self._lock:
+            self._file_signature = None
+            self._next_check = None
 
-    if not secrets_path.exists():
-        return default
+    def _reload_if_changed(self) -> None:
+        try:
+            stat = self._path.stat()
+        except FileNotFoundError:
+            self._data = {}
+            self._file_signature = None
+            return
 
-    with open(secrets_path, "r") as f:
-        data = json.load(f)
+        signature = (stat.st_mtime_ns, stat.st_size)
 
-        if key not in data:
-            return default
+        if signature == self._file_signature:
+            return
 
-        return data[key]
+        with open(self._path, "r") as f:
+            self._data = json.load(f)
+
+        self._file_signature = signature
+
+
+_secrets_store = SecretsStore(_rel_to_py("secrets", "secrets.json"))
+
+
+def reload_secrets() -> None:
+    _secrets_store.reload()
+
+
+def get_secret_or_else(key: str, default: Any) -> Any:
+    return _secrets_store.get(key, default)
@@ -0,0 +1,357 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Tuple
+
+from pyziggy.broadcasters import ListenerCancellationToken
+from pyziggy.devices_client import DevicesClient
+from pyziggy.message_loop import MessageLoopTimer, message_loop
+from pyziggy.parameters import EnumParameter, NumericParameter
+
+from device_state import DeviceStateLog, get_device_state_log, get_leaf_parameters
+from project_config import get_config_section
+
+logger = logging.getLogger(__name__)
+
+
+def _rel_to_py(*paths) -> Path:
+    return Path(
+        os.path.realpath(
+            os.path.join(os.path.realpath(os.path.dirname(__file__)), *paths)
+        )
+    )
+
+
+class StateCache:
+    """
+    Persists the values of all device parameters, and any number of named values of
+    the automation, so that they are known right after a restart instead of only
+    once the devices report them.
+
+    The file at ``path`` is append-only JSON lines. The first line holds all values,
+    and the following ones the values that changed since, appended every
+    ``snapshot_interval`` seconds. Once more than ``max_appends`` lines were
+    appended, or when the message loop stops, the file is replaced by a single line
+    with all values. A partially written last line is ignored when loading.
+
+    The changes are collected on the message thread from the shared
+    :class:`DeviceStateLog`, but serialized and written by a writer thread, so file
+    I/O never delays the message loop. The writer runs until :meth:`close` is
+    called. Each time the message loop stops, the file is compacted and the stop
+    waits for the pending writes, so nothing is lost when the process exits.
+
+    :meth:`rehydrate` has to be called before connecting. It loads the cached values
+    into the parameters as if they had been requested, without sending anything to
+    the devices or calling listeners. Settable parameters remain stale, so the first
+    write to each is always sent, and reports from the devices overwrite the cached
+    values as they arrive.
+    """
+
+    def __init__(
+        self,
+        devices: DevicesClient,
+        path: Path,
+        snapshot_interval: float = 30.0,
+        max_appends: int = 100,
+    ):
+        self._devices = devices
+        self._path = path
+        self._snapshot_interval = snapshot_interval
+        self._max_appends = max_appends
+        self._lock = threading.Lock()
+
+        self._params: Dict[Tuple[str, str], NumericParameter] = {}
+        self._keys: Dict[NumericParameter, Tuple[str, str]] = {}
+
+        for device in devices.get_devices():
+            for field, param in get_leaf_parameters(device):
+                key = (device._get_topic(), field)
+                self._params[key] = param
+                self._keys[param] = key
+
+        self._extras: Dict[str, Tuple[Callable[[], Any], Callable[[Any], None]]] = {}
+        self._written_extras: Dict[str, str] = {}
+
+        self._state_log: DeviceStateLog | None = None
+        self._sequence_number = 0
+        self._appends = 0
+        self._timer = MessageLoopTimer(self._timer_callback)
+
+        # Holds ("append" | "replace", record) tuples, and None to stop the writer
+        self._writes: queue.Queue[Tuple[str, Dict[str, Any]] | None] = queue.Queue()
+        self._writer = threading.Thread(
+            target=self._write_records, name="state_cache", daemon=True
+        )
+        self._needs_compaction = False
+        self._on_stop_token: ListenerCancellationToken | None = None
+
+        self.rehydrated = 0
+
+    def register(
+        self, name: str, get: Callable[[], Any], set: Callable[[Any], None]
+    ) -> None:
+        """
+        Persists the JSON serializable value returned by ``get`` under ``name``.
+        :meth:`rehydrate` passes the cached value to ``set``.
+        """
+        self._extras[name] = (get, set)
+
+    def get_key(self, param: NumericParameter) -> Tuple[str, str]:
+        """
+        :return: The device and field name of a parameter, for persisting references
+                 to it in registered values.
+        """
+        return self._keys[param]
+
+    def get_parameter(self, key: Any) -> NumericParameter | None:
+        """
+        :return: The parameter returned by :meth:`get_key`, or None if it no longer
+                 exists.
+        """
+        try:
+            return self._params.get((key[0], key[1]))
+        except (TypeError, IndexError):
+            return None
+
+    def rehydrate(self) -> None:
+        """
+        Loads the cached values, and starts persisting changes.
+        """
+        values, extras = self._load()
+        self._needs_compaction = not self._path.exists()
+
+        for device, fields in values.items():
+            for field, value in fields.items():
+                param = self._params.get((device, field))
+
+                if param is not None and value is not None:
+                    self._restore(param, value)
+                    self.rehydrated += 1
+
+        for name, value in extras.items():
+            if name in self._extras:
+                self._extras[name][1](value)
+
+        # Shared with the HTTP interfaces. It's created after restoring, so that the
+        # restored values aren't logged as changes.
+        self._state_log = get_device_state_log(self._devices)
+        self._sequence_number = self._state_log.get_sequence_number()
+        self._written_extras = {
+            name: json.dumps(value, sort_keys=True) for name, value in extras.items()
+        }
+
+        self._writer.start()
+        self._on_stop_token = message_loop.on_stop.add_listener(self._on_loop_stop)
+        self._timer.start(self._snapshot_interval)
+
+        logger.info(f"Restored {self.rehydrated} parameter values from {self._path}")
+
+    def flush(self) -> None:
+        """
+        Appends the values that changed since the last flush, or replaces the file if
+        it has grown too long.
+        """
+        with self._lock:
+            if self._state_log is None:
+                return
+
+            if self._appends >= self._max_appends or self._needs_compaction:
+                self._compact()
+                return
+
+            changes = self._state_log.get_changes_since(self._sequence_number)
+
+            if changes is None:
+                self._compact()
+                return
+
+            self._sequence_number, values = changes
+            extras = self._get_changed_extras()
+
+            if not values and not extras:
+                return
+
+            record: Dict[str, Any] = {}
+
+            if values:
+                record["values"] = values
+
+            if extras:
+                record["extras"] = extras
+
+            self._writes.put(("append", record))
+            self._appends += 1
+
+    def compact(self) -> None:
+        """
+        Replaces the file with a single line holding all values.
+        """
+        with self._lock:
+            if self._state_log is not None:
+                self._compact()
+
+    def close(self) -> None:
+        """
+        Replaces the file with a single line holding all values, and stops the writer
+        thread once it's written. Later changes aren't persisted.
+        """
+        if self._on_stop_token is not None:
+            self._on_stop_token.stop_listening()
+            self._on_stop_token = None
+
+        self._timer.stop()
+
+        with self._lock:
+            if self._state_log is None:
+                return
+
+            self._compact()
+            self._state_log = None
+
+        self._writes.put(None)
+        self._writer.join()
+
+    def _on_loop_stop(self) -> None:
+        self.compact()
+        self._writes.join()
+
+    def _compact(self) -> None:
+        assert self._state_log is not None
+
+        self._sequence_number, values = self._state_log.get_snapshot()
+        self._get_changed_extras()
+
+        record = {
+            "values": values,
+            "extras": {
+                name: json.loads(value) for name, value in self._written_extras.items()
+            },
+        }
+
+        self._writes.put(("replace", record))
+        self._appends = 0
+        self._needs_compaction = False
+
+    def _write_records(self) -> None:
+        while True:
+            write = self._writes.get()
+
+            if write is None:
+                return
+
+            mode, record = write
+            line = json.dumps(record, separators=(",", ":")) + "\n"
+
+            try:
+                if mode == "append":
+                    self._append(line)
+                else:
+                    self._replace(line)
+            except OSError as e:
+                logger.warning(f"Failed to write the state cache {self._path}: {e}")
+                self._needs_compaction = True
+            finally:
+                self._writes.task_done()
+
+    def _append(self, line: str) -> None:
+        # Appending to a missing file would lose the values of the first line
+        if not self._path.exists():
+            self._needs_compaction = True
+            return
+
+        with open(self._path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def _replace(self, line: str) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self._path.with_suffix(".tmp")
+
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(line)
+
+        os.replace(temp_path, self._path)
+
+    def _get_changed_extras(self) -> Dict[str, Any]:
+        changed: Dict[str, Any] = {}
+
+        for name, (get, _) in self._extras.items():
+            value = get()
+            serialized = json.dumps(value, sort_keys=True)
+
+            if self._written_extras.get(name) != serialized:
+                self._written_extras[name] = serialized
+                changed[name] = value
+
+        return changed
+
+    def _load(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Any]]:
+        values: Dict[str, Dict[str, Any]] = {}
+        extras: Dict[str, Any] = {}
+
+        if not self._path.exists():
+            return values, extras
+
+        start = time.perf_counter()
+        lines = 0
+
+        with open(self._path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring a corrupt line in {self._path}")
+                    continue
+
+                for device, fields in record.get("values", {}).items():
+                    values.setdefault(device, {}).update(fields)
+
+                extras.update(record.get("extras", {}))
+                lines += 1
+
+        logger.debug(
+            f"Loaded {lines} lines from {self._path} in"
+            f" {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+
+        return values, extras
+
+    @staticmethod
+    def _restore(param: NumericParameter, value: Any) -> None:
+        if isinstance(param, EnumParameter):
+            internal_value = param._transform_mqtt_to_internal_value(value)
+        else:
+            internal_value = float(value)
+
+        param._requested_value = min(
+            param._max_value, max(param._min_value, internal_value)
+        )
+
+    def _timer_callback(self, timer: MessageLoopTimer) -> None:
+        self.flush()
+
+
+_config = get_config_section("state_cache")
+
+# Set in the [state_cache] section of config.toml. Tools that run the automation
+# against simulated devices set this to False before importing automation.py, so
+# that they neither read nor overwrite the real cache.
+enabled: bool = bool(_config.get("enabled", False))
+
+
+def create_state_cache(devices: DevicesClient) -> StateCache | None:
+    """
+    :return: A StateCache configured by the ``[state_cache]`` section of
+             config.toml, or None if it's disabled.
+    """
+    if not enabled:
+        return None
+
+    return StateCache(
+        devices,
+        _rel_to_py(_config.get("path", "state_cache/state.jsonl")),
+        snapshot_interval=_config.get("snapshot_interval", 30),
+    )
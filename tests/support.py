@@ -0,0 +1,104 @@
+"""
+Helpers for tests that run devices against an :class:`InProcessMqttClientImpl`
+instead of a broker.
+
+Importing this module switches pyziggy to a :class:`FastForwardTimeSource`, like
+pyziggy's own tests do, so :func:`run_for` doesn't actually wait for timers. It
+also disables the state cache, so it has to be imported before automation.py.
+"""
+
+import contextlib
+import io
+import unittest
+from typing import Any, Dict, List, Tuple
+
+import pyziggy.message_loop as ml
+from pyziggy.devices_client import Device
+from pyziggy.message_loop import FastForwardTimeSource, MessageLoopTimer, message_loop
+from pyziggy.workarounds import applied_workarounds
+
+import state_cache
+from in_process_mqtt import InProcessMqttClientImpl
+from pyziggy_autogenerate.available_devices import AvailableDevices
+
+ml.time_source = FastForwardTimeSource()
+
+# Tests that import automation.py must neither read nor overwrite the real cache
+state_cache.enabled = False
+
+BASE_TOPIC = "zigbee2mqtt"
+
+
+def run_for(seconds: float) -> None:
+    """
+    Runs the message loop for ``seconds`` of fast forwarded time. Messages posted
+    before the call, and any they cause, are processed.
+    """
+
+    # Fast forwarded timers fire right away, possibly before the listeners posted by
+    # earlier messages had a chance to run. Posting the stop behind a few generations
+    # of messages lets those finish.
+    def stop_after(generations: int) -> None:
+        if generations == 0:
+            message_loop.stop()
+        else:
+            message_loop.post_message(lambda: stop_after(generations - 1))
+
+    def stop(timer: MessageLoopTimer) -> None:
+        timer.stop()
+        stop_after(10)
+
+    stop_timer = MessageLoopTimer(stop)
+    stop_timer.start(seconds)
+    message_loop.run()
+
+
+class InProcessTestCase(unittest.TestCase):
+    """
+    Creates a connected :class:`AvailableDevices` for each test, with pyziggy's
+    workarounds applied, and records everything it publishes in ``published``.
+
+    Override :meth:`before_connect` to add objects that have to exist before the
+    devices connect.
+    """
+
+    def setUp(self) -> None:
+        self.impl = InProcessMqttClientImpl()
+        self.devices = AvailableDevices(self.impl)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            applied_workarounds._apply(self.devices)
+
+        self.published: List[Tuple[str, Dict[str, Any]]] = []
+        self.impl.on_publish.add_listener(
+            lambda topic, payload: self.published.append((topic, payload))
+        )
+
+        self.before_connect()
+        self.devices._set_skip_initial_query(True)
+        self.devices._connect("in-process", 0, 0, BASE_TOPIC)
+        run_for(0.1)
+
+    def before_connect(self) -> None:
+        pass
+
+    def inject(self, topic: str, payload: Any) -> None:
+        """
+        Delivers a message on ``topic`` below the base topic, and processes the
+        messages it causes.
+        """
+        self.impl.inject(f"{BASE_TOPIC}/{topic}", payload)
+        run_for(0.1)
+
+    def report(self, device: Device, payload: Dict[str, Any]) -> None:
+        """
+        Delivers a state report of ``device``, and processes the messages it causes.
+        """
+        self.inject(device._get_topic(), payload)
+
+    def get_publishes(self, device: Device) -> List[Dict[str, Any]]:
+        """
+        :return: The payloads published to the ``/set`` topic of ``device``.
+        """
+        topic = f"{BASE_TOPIC}/{device._get_topic()}/set"
+        return [payload for t, payload in self.published if t == topic]
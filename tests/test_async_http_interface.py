@@ -0,0 +1,164 @@
+import contextlib
+import io
+import json
+import socket
+import threading
+import time
+import unittest
+from typing import Any, Dict, Iterator, List, Tuple
+from unittest.mock import patch
+
+from tests.support import InProcessTestCase  # disables the state cache
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import async_http_interface
+    from async_http_interface import AsyncHttpServer
+
+from device_state import DeviceStateLog
+
+
+class AsyncHttpServerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = AsyncHttpServer(host="127.0.0.1", port=0)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.server.start()
+
+        self.addCleanup(self.server.stop)
+
+    def request(self, data: bytes) -> bytes:
+        with socket.create_connection(("127.0.0.1", self.server.get_port())) as s:
+            s.settimeout(5)
+            s.sendall(data)
+            response = b""
+
+            while chunk := s.recv(4096):
+                response += chunk
+
+        return response
+
+
+class AsyncHttpServerTest(AsyncHttpServerTestCase):
+    def test_chunked_request_is_rejected(self) -> None:
+        response = self.request(
+            b"POST /pyziggy/post HTTP/1.1\r\n"
+            b"Transfer-Encoding: chunked\r\n\r\n"
+            b'11\r\n{"action": "x"}\r\n0\r\n\r\n'
+            b"GET /pyziggy/state HTTP/1.1\r\n\r\n"
+        )
+
+        # Only one response, the connection is closed after it
+        self.assertTrue(response.startswith(b"HTTP/1.1 501 Not Implemented\r\n"))
+        self.assertIn(b"Connection: close\r\n", response)
+        self.assertEqual(response.count(b"HTTP/1.1"), 1)
+
+    def test_keep_alive(self) -> None:
+        response = self.request(
+            b"GET /pyziggy/state/none HTTP/1.1\r\n\r\n"
+            b"GET /pyziggy/state/none HTTP/1.1\r\nConnection: close\r\n\r\n"
+        )
+
+        self.assertEqual(response.count(b"HTTP/1.1 404 Not Found\r\n"), 2)
+
+    def test_start_raises_if_the_port_is_in_use(self) -> None:
+        server = AsyncHttpServer(host="127.0.0.1", port=self.server.get_port())
+
+        with self.assertRaises(OSError):
+            server.start()
+
+        server.stop()
+
+
+class DeviceStateStreamTest(InProcessTestCase):
+    def before_connect(self) -> None:
+        self.server = AsyncHttpServer(host="127.0.0.1", port=0)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.server.start()
+
+        self.addCleanup(self.server.stop)
+
+        # A reader falls behind after a few changes
+        self.state_log = DeviceStateLog(self.devices, capacity=4)
+        patcher = patch.object(async_http_interface, "device_state", self.state_log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def set_brightness(self, brightness: int) -> None:
+        self.report(self.devices.fado, {"brightness": brightness})
+
+    @contextlib.contextmanager
+    def stream(self, fps: float) -> Iterator[Iterator[Tuple[str, Dict[str, Any]]]]:
+        with socket.create_connection(("127.0.0.1", self.server.get_port())) as s:
+            s.settimeout(5)
+            s.sendall(f"GET /pyziggy/state/stream?fps={fps} HTTP/1.1\r\n\r\n".encode())
+
+            with s.makefile("rb") as f:
+                self.assertEqual(f.readline(), b"HTTP/1.1 200 OK\r\n")
+
+                while f.readline() != b"\r\n":
+                    pass
+
+                def events() -> Iterator[Tuple[str, Dict[str, Any]]]:
+                    while True:
+                        event = f.readline().decode().removeprefix("event: ").strip()
+                        data = f.readline().decode().removeprefix("data: ")
+                        f.readline()
+                        yield event, json.loads(data)
+
+                yield events()
+
+    def test_snapshot_then_diff(self) -> None:
+        with self.stream(fps=30) as events:
+            event, snapshot = next(events)
+
+            self.assertEqual(event, "snapshot")
+            self.assertEqual(len(snapshot), len(self.devices.get_devices()))
+            self.assertEqual(snapshot["Fado"]["brightness"], 0)
+
+            self.set_brightness(10)
+
+            self.assertEqual(next(events), ("diff", {"Fado": {"brightness": 10}}))
+
+    def test_events_are_limited_to_fps(self) -> None:
+        times: List[float] = []
+
+        with self.stream(fps=5) as events:
+            self.assertEqual(next(events)[0], "snapshot")
+
+            def read() -> None:
+                # Diffs, or snapshots if more than 4 changes happened in between
+                for _ in events:
+                    times.append(time.monotonic())
+
+                    if len(times) == 5:
+                        return
+
+            reader = threading.Thread(target=read)
+            reader.start()
+            brightness = 0
+
+            while reader.is_alive():
+                brightness = brightness % 254 + 1
+                self.set_brightness(brightness)
+
+        intervals = [b - a for a, b in zip(times, times[1:])]
+        self.assertEqual(len(intervals), 4)
+        self.assertGreater(min(intervals), 0.15)
+
+    def test_reader_that_fell_behind_gets_a_snapshot(self) -> None:
+        with self.stream(fps=1) as events:
+            self.assertEqual(next(events)[0], "snapshot")
+
+            # More changes than the log keeps, while the stream waits a second
+            for brightness in range(1, 10):
+                self.set_brightness(brightness)
+
+            event, snapshot = next(events)
+
+            self.assertEqual(event, "snapshot")
+            self.assertEqual(snapshot["Fado"]["brightness"], 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import contextlib
+import io
+import unittest
+from typing import Any, Dict, List, Tuple
+
+from pyziggy.message_loop import message_loop
+from pyziggy.workarounds import applied_workarounds
+
+from tests.support import BASE_TOPIC, run_for
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import automation
+
+from audio_cues import NullBackend, audio_cues
+from in_process_mqtt import InProcessMqttClientImpl, use_in_process_impl
+
+devices = automation.devices
+
+
+class AutomationTest(unittest.TestCase):
+    """
+    Runs the handlers of automation.py against its module level ``devices``, which
+    can only connect once, so all tests share the connection.
+    """
+
+    impl: InProcessMqttClientImpl
+    published: List[Tuple[str, Dict[str, Any]]] = []
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        audio_cues._backend = NullBackend()
+        cls.impl = use_in_process_impl(devices)
+        cls.impl.on_publish.add_listener(
+            lambda topic, payload: cls.published.append((topic, payload))
+        )
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            applied_workarounds._apply(devices)
+
+        devices._set_skip_initial_query(True)
+        devices._connect("in-process", 0, 0, BASE_TOPIC)
+        run_for(0.1)
+
+    def setUp(self) -> None:
+        self.published.clear()
+
+    def report(self, lights: List[Any], payload: Dict[str, Any]) -> None:
+        for light in lights:
+            self.impl.inject(f"{BASE_TOPIC}/{light._get_topic()}", payload)
+
+        run_for(0.1)
+        self.published.clear()
+
+    def call(self, handler: Any) -> None:
+        message_loop.post_message(handler)
+        run_for(0.1)
+
+    def get_publishes(self, device: Any) -> List[Dict[str, Any]]:
+        topic = f"{BASE_TOPIC}/{device._get_topic()}/set"
+        return [payload for t, payload in self.published if t == topic]
+
+    def test_morning_lights_are_set_with_one_message_each(self) -> None:
+        lights: List[Any] = list(automation.morning_lights)
+        self.report(lights, {"state": "OFF", "brightness": 10})
+        self.call(automation.turn_on_morning_lights)
+
+        for light in lights:
+            publishes = self.get_publishes(light)
+            self.assertEqual(len(publishes), 1, light._get_topic())
+            self.assertEqual(publishes[0]["state"], "ON")
+
+        # State and brightness are merged, even though they are set separately
+        self.assertEqual(
+            self.get_publishes(devices.dining_light_1)[0]["brightness"], 127
+        )
+        self.assertEqual(self.get_publishes(devices.tokabo)[0]["brightness"], 254)
+
+    def test_office_is_toggled_with_one_message_per_light(self) -> None:
+        lights: List[Any] = list(automation.office)
+        self.report(lights, {"state": "OFF", "brightness": 10})
+        self.call(automation.toggle_office)
+
+        for light in lights:
+            publishes = self.get_publishes(light)
+            self.assertEqual(len(publishes), 1, light._get_topic())
+            self.assertEqual(publishes[0]["state"], "ON")
+            self.assertEqual(publishes[0]["brightness"], 254)
+
+        self.report(lights, {"state": "ON", "brightness": 254})
+        self.call(automation.toggle_office)
+
+        for light in lights:
+            self.assertEqual(self.get_publishes(light), [{"state": "OFF"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,187 @@
+import unittest
+from typing import List
+
+from pyziggy.util import LightWithDimmingScalable as L2S
+from pyziggy.util import ScaleMapper
+
+from device_helpers import (
+    BrightnessMover,
+    ParameterWriteCache,
+    PhilipsTapDialRotaryHelper,
+)
+from tests.support import InProcessTestCase, run_for
+
+
+class ParameterWriteCacheTest(InProcessTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = ParameterWriteCache()
+        self.light = self.devices.dining_light_1
+        self.report(self.light, {"state": "ON", "brightness": 254, "color_temp": 370})
+        self.published.clear()
+
+    def test_unchanged_value_is_not_sent(self) -> None:
+        # The first write after turning on is sent, as the workarounds mark the
+        # color stale
+        self.cache.set(self.light.color_temp, 370)
+        self.report(self.light, {})
+        self.published.clear()
+
+        self.cache.set(self.light.color_temp, 370)
+        self.report(self.light, {})
+
+        self.assertEqual(self.get_publishes(self.light), [])
+        self.assertEqual((self.cache.sent, self.cache.suppressed), (1, 1))
+
+    def test_writes_in_one_callback_count_as_one_publish(self) -> None:
+        self.cache.set(self.light.color_temp, 300)
+        self.cache.set(self.light.color_temp, 310)
+        self.report(self.light, {})
+
+        self.assertEqual(self.get_publishes(self.light), [{"color_temp": 310}])
+        self.assertEqual((self.cache.sent, self.cache.suppressed), (1, 1))
+
+    def test_stale_value_is_sent_after_turning_back_on(self) -> None:
+        # Like change_mired_for_light in automation.py
+        def change_mired_for_light() -> None:
+            if self.light.state.get() > 0:
+                self.cache.set(self.light.color_temp, 370)
+
+        self.light.state.add_listener(change_mired_for_light)
+
+        self.cache.set(self.light.color_temp, 370)
+        self.report(self.light, {"color_temp": 370})
+        self.published.clear()
+
+        self.report(self.light, {"state": "OFF"})
+        self.report(self.light, {"state": "ON"})
+
+        self.assertEqual(self.get_publishes(self.light), [{"color_temp": 370}])
+        self.assertEqual(self.cache.sent, 2)
+
+    def test_write_to_light_that_is_off_is_deferred(self) -> None:
+        self.report(self.light, {"state": "OFF"})
+        self.cache.set_when_on(self.light, self.light.color_temp, 250)
+        self.report(self.light, {})
+
+        self.assertEqual(self.get_publishes(self.light), [])
+        self.assertEqual(self.cache.deferred, 1)
+
+        self.report(self.light, {"state": "ON"})
+
+        self.assertEqual(self.get_publishes(self.light), [{"color_temp": 250}])
+
+
+class BrightnessMoverTest(InProcessTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.lampion = self.devices.lampion
+        self.fado = self.devices.fado
+        self.mover = BrightnessMover(
+            [self.lampion, self.fado], rate=60, max_brightness={self.fado: 0.55}
+        )
+
+        for light in (self.lampion, self.fado):
+            self.report(light, {"state": "ON", "brightness": 100})
+
+        self.published.clear()
+
+    def test_move_up_stops_at_max_brightness(self) -> None:
+        self.mover.start(1)
+        self.report(self.fado, {})
+
+        self.assertEqual(self.get_publishes(self.lampion), [{"brightness_move": 60}])
+        self.assertEqual(
+            self.get_publishes(self.fado), [{"brightness": 140, "transition": 0.7}]
+        )
+
+    def test_move_down_ignores_max_brightness(self) -> None:
+        self.mover.start(-1)
+        self.mover.stop()
+        self.report(self.fado, {})
+
+        self.assertEqual(
+            self.get_publishes(self.fado),
+            [{"brightness_move": -60}, {"brightness_move": 0}],
+        )
+
+    def test_light_at_max_brightness_isnt_moved_up(self) -> None:
+        self.report(self.fado, {"brightness": 140})
+        self.mover.start(1)
+        self.mover.stop()
+        self.report(self.fado, {})
+
+        self.assertEqual(self.get_publishes(self.fado), [])
+        self.assertEqual(len(self.get_publishes(self.lampion)), 2)
+
+
+class PhilipsTapDialRotaryHelperTest(InProcessTestCase):
+    def before_connect(self) -> None:
+        self.dial = self.devices.switch_kitchen
+        self.helper = PhilipsTapDialRotaryHelper(self.dial, frame=0.08)
+        self.rotations: List[int] = []
+        self.helper.on_rotate.add_listener(self.rotations.append)
+
+        # Like kitchen_dimmer in automation.py
+        mapper = ScaleMapper(
+            [
+                (L2S(self.devices.dining_light_1), 0.0, 1.0),
+                (L2S(self.devices.dining_light_2), 0.0, 1.0),
+            ]
+        )
+        self.helper.on_rotate.add_listener(lambda step: mapper.add(step / 8 * 0.022))
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        for light in (self.devices.dining_light_1, self.devices.dining_light_2):
+            self.report(light, {"state": "ON", "brightness": 20})
+
+        self.published.clear()
+
+    def spin(self, action: str, steps: int, in_one_frame: bool) -> None:
+        for _ in range(steps):
+            self.impl.inject(
+                f"zigbee2mqtt/{self.dial._get_topic()}",
+                {"action": action, "action_step_size": 8},
+            )
+
+            if not in_one_frame:
+                run_for(0.2)
+
+        run_for(0.2)
+
+    def test_burst_is_summed(self) -> None:
+        self.spin("brightness_step_up", 20, in_one_frame=True)
+
+        # The first step is emitted right away, the rest at the end of the frame
+        self.assertEqual(self.rotations, [8, 152])
+        self.assertEqual(self.helper.steps_received, 20)
+        self.assertEqual(self.helper.rotations_emitted, 2)
+        self.assertEqual(
+            self.get_publishes(self.devices.dining_light_1)[-1]["brightness"], 132
+        )
+
+    def test_burst_down_is_summed(self) -> None:
+        self.spin("brightness_step_down", 5, in_one_frame=True)
+
+        self.assertEqual(sum(self.rotations), -40)
+        self.assertEqual(self.helper.rotations_emitted, 2)
+
+    def test_burst_saves_writes(self) -> None:
+        self.spin("brightness_step_up", 20, in_one_frame=False)
+        slow_writes = len(self.published)
+        self.published.clear()
+
+        self.spin("brightness_step_up", 20, in_one_frame=True)
+        burst_writes = len(self.published)
+
+        # Each rotation writes the brightness of both lights, but the two rotations
+        # of the burst may end up in the same publish
+        self.assertEqual(self.helper.rotations_emitted, 22)
+        self.assertEqual(slow_writes, 40)
+        self.assertLessEqual(burst_writes, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import unittest
+
+from device_state import DeviceStateLog
+from tests.support import InProcessTestCase
+
+
+class DeviceStateLogTest(InProcessTestCase):
+    def before_connect(self) -> None:
+        self.log = DeviceStateLog(self.devices, capacity=4)
+
+    def test_changes_since_a_snapshot(self) -> None:
+        sequence_number, snapshot = self.log.get_snapshot()
+        self.assertEqual(snapshot["Fado"]["brightness"], 0)
+
+        self.report(self.devices.fado, {"state": "ON", "brightness": 10})
+        self.report(self.devices.fado, {"brightness": 20})
+        self.report(self.devices.lampion, {"linkquality": 100})
+
+        # Only the latest value of each changed field
+        sequence_number, changes = self.log.get_changes_since(sequence_number) or (
+            0,
+            {},
+        )
+        self.assertEqual(
+            changes,
+            {"Fado": {"state": 1, "brightness": 20}, "Lampion": {"linkquality": 100}},
+        )
+
+        self.assertEqual(self.log.get_changes_since(sequence_number), (4, {}))
+
+    def test_reader_that_fell_behind_needs_a_snapshot(self) -> None:
+        sequence_number = self.log.get_sequence_number()
+
+        for brightness in range(1, 9):
+            self.report(self.devices.fado, {"brightness": brightness})
+
+        self.assertIsNone(self.log.get_changes_since(sequence_number))
+
+        sequence_number, snapshot = self.log.get_snapshot()
+        self.assertEqual(snapshot["Fado"]["brightness"], 8)
+        self.assertEqual(self.log.get_changes_since(sequence_number), (8, {}))
+
+    def test_state_json(self) -> None:
+        self.report(self.devices.fado, {"state": "ON", "brightness": 10})
+        state = self.log.get_state_json()
+
+        self.assertEqual(json.loads(state)["Fado"]["brightness"], 10)
+        self.assertIs(self.log.get_state_json(), state)
+
+        self.report(self.devices.fado, {"brightness": 20})
+
+        self.assertEqual(
+            json.loads(self.log.get_state_json())["Fado"]["brightness"], 20
+        )
+        self.assertEqual(
+            json.loads(self.log.get_device_json("Fado") or b""),
+            json.loads(self.log.get_state_json())["Fado"],
+        )
+        self.assertIsNone(self.log.get_device_json("none"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List, Tuple
+
+from pushover import PushoverDispatcher
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Answers the Pushover requests after ``latency`` seconds, with the statuses in
+    ``statuses`` and then 200. ``requests`` holds the client port and the message
+    of each request. While ``blocked`` is set, requests aren't answered.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, statuses: List[int] | None = None):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency = latency
+        self.statuses = list(statuses or [])
+        self.requests: List[Tuple[int, str]] = []
+        self.received = threading.Event()
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StandInServer
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        message = urllib.parse.parse_qs(body)["message"][0]
+        self.server.requests.append((self.client_address[1], message))
+        self.server.received.set()
+        self.server.unblocked.wait(5)
+        time.sleep(self.server.latency)
+
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class PushoverDispatcherTest(unittest.TestCase):
+    def create_dispatcher(self, server: StandInServer, **kwargs) -> PushoverDispatcher:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        return PushoverDispatcher(
+            host="127.0.0.1",
+            port=server.server_address[1],
+            use_https=False,
+            app_token="token",
+            group_key="group",
+            **kwargs,
+        )
+
+    def test_send_does_not_block(self) -> None:
+        server = StandInServer(latency=0.2)
+        dispatcher = self.create_dispatcher(server)
+
+        start = time.perf_counter()
+        dispatcher.send("Water sensor alert!")
+        dispatcher.send("Plug turned off")
+        stall = time.perf_counter() - start
+
+        self.assertLess(stall, 0.05)
+        dispatcher._queue.join()
+        self.assertEqual(dispatcher.sent, 2)
+
+        # Both requests used the same connection
+        self.assertEqual(len({port for port, _ in server.requests}), 1)
+
+    def test_retries_with_backoff(self) -> None:
+        server = StandInServer(statuses=[503, 503])
+        dispatcher = self.create_dispatcher(server, initial_backoff=0.05)
+
+        start = time.perf_counter()
+        dispatcher.send("Water sensor alert!")
+        dispatcher._queue.join()
+
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(dispatcher.sent, 1)
+        self.assertEqual(dispatcher.failed, 0)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.05 + 0.1)
+
+    def test_gives_up_after_max_attempts(self) -> None:
+        server = StandInServer(statuses=[503] * 3)
+        dispatcher = self.create_dispatcher(
+            server, max_attempts=3, initial_backoff=0.01
+        )
+
+        with self.assertLogs("pushover", "WARNING"):
+            dispatcher.send("Water sensor alert!")
+            dispatcher._queue.join()
+
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(dispatcher.failed, 1)
+
+    def test_duplicates_are_dropped(self) -> None:
+        server = StandInServer()
+        dispatcher = self.create_dispatcher(server, dedup_window=10)
+
+        self.assertTrue(dispatcher.send("Water sensor alert!"))
+        self.assertFalse(dispatcher.send("Water sensor alert!"))
+        self.assertTrue(dispatcher.send("Plug turned off"))
+        dispatcher._queue.join()
+
+        self.assertEqual(
+            [message for _, message in server.requests],
+            ["Water sensor alert!", "Plug turned off"],
+        )
+        self.assertEqual(dispatcher.dropped, 1)
+
+    def test_full_queue_drops_messages(self) -> None:
+        server = StandInServer()
+        server.unblocked.clear()
+        dispatcher = self.create_dispatcher(server, max_queue_size=1)
+
+        dispatcher.send("1")
+        self.assertTrue(server.received.wait(5))
+        self.assertTrue(dispatcher.send("2"))
+
+        with self.assertLogs("pushover", "WARNING"):
+            self.assertFalse(dispatcher.send("3"))
+
+        server.unblocked.set()
+        dispatcher._queue.join()
+
+        self.assertEqual([message for _, message in server.requests], ["1", "2"])
+        self.assertEqual(dispatcher.dropped, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
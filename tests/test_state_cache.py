@@ -0,0 +1,77 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from pyziggy.message_loop import message_loop
+
+from device_state import get_device_state_log
+from state_cache import StateCache
+from tests.support import InProcessTestCase
+
+
+class StateCacheTest(InProcessTestCase):
+    def before_connect(self) -> None:
+        # Called again by the restart in test_values_survive_a_restart
+        if not hasattr(self, "path"):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            self.path = Path(directory.name) / "state.jsonl"
+
+        self.cache = self.create_cache()
+
+    def create_cache(self) -> StateCache:
+        cache = StateCache(self.devices, self.path)
+        self.turned_off = ["Lampion"]
+        cache.register("turned_off", lambda: self.turned_off, self.set_turned_off)
+        cache.rehydrate()
+        self.addCleanup(cache.close)
+        return cache
+
+    def set_turned_off(self, value: list) -> None:
+        self.turned_off = value
+
+    def test_values_survive_a_restart(self) -> None:
+        self.report(self.devices.fado, {"state": "ON", "brightness": 120})
+        self.cache.flush()
+        self.turned_off = ["Fado", "Lampion"]
+        self.cache.close()
+
+        # A restart, with new devices that haven't reported anything yet
+        self.setUp()
+
+        self.assertEqual(self.devices.fado.brightness.get(), 120)
+        self.assertEqual(self.devices.fado.state.get(), 1)
+        self.assertEqual(self.turned_off, ["Fado", "Lampion"])
+
+    def test_changes_are_appended(self) -> None:
+        # The first flush writes all values, as there was no file yet
+        self.cache.flush()
+        self.turned_off = ["Fado"]
+        self.cache.flush()
+        self.turned_off = []
+        self.cache.flush()
+        self.cache._writes.join()
+
+        self.assertEqual(len(self.path.read_text().splitlines()), 3)
+
+    def test_stopping_the_loop_compacts_the_file(self) -> None:
+        self.cache.flush()
+        self.turned_off = ["Fado"]
+        self.cache.flush()
+
+        # Like pyziggy does on exit. The stop waits for the writes to finish.
+        message_loop.stop()
+        self.assertEqual(len(self.path.read_text().splitlines()), 1)
+
+        # The writer keeps running, as the loop may be started again
+        self.turned_off = []
+        self.cache.flush()
+        self.cache._writes.join()
+        self.assertEqual(len(self.path.read_text().splitlines()), 2)
+
+    def test_shares_the_device_state_log(self) -> None:
+        self.assertIs(self.cache._state_log, get_device_state_log(self.devices))
+
+
+if __name__ == "__main__":
+    unittest.main()
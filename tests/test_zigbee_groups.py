@@ -0,0 +1,115 @@
+import unittest
+from typing import Any, Dict, List
+
+from tests.support import BASE_TOPIC, InProcessTestCase
+from zigbee_groups import ZigbeeGroups
+
+
+class ZigbeeGroupTest(InProcessTestCase):
+    def before_connect(self) -> None:
+        self.lights: List[Any] = [
+            self.devices.dining_light_1,
+            self.devices.dining_light_2,
+            self.devices.lampion,
+            self.devices.fado,
+        ]
+        self.zigbee_groups = ZigbeeGroups(self.devices)
+        self.group = self.zigbee_groups.add("test_lights", self.lights)
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        for light in self.lights:
+            self.report(light, {"state": "OFF", "brightness": 50})
+
+        self.report_bridge_group([light._get_topic() for light in self.lights])
+        self.published.clear()
+
+    def report_bridge_group(self, member_names: List[str]) -> None:
+        devices = [
+            {"ieee_address": f"0x{i:016x}", "friendly_name": name}
+            for i, name in enumerate(member_names)
+        ]
+        self.inject("bridge/devices", devices)
+        self.inject(
+            "bridge/groups",
+            [
+                {
+                    "friendly_name": "test_lights",
+                    "members": [{"ieee_address": d["ieee_address"]} for d in devices],
+                }
+            ],
+        )
+
+    def get_group_publishes(self) -> List[Dict[str, Any]]:
+        topic = f"{BASE_TOPIC}/test_lights/set"
+        return [payload for t, payload in self.published if t == topic]
+
+    def get_device_publish_count(self) -> int:
+        return sum(len(self.get_publishes(light)) for light in self.lights)
+
+    def test_uniform_writes_become_one_group_message(self) -> None:
+        self.assertTrue(self.group.is_in_sync())
+
+        self.group.set("state", 1)
+        self.group.set_normalized("brightness", 1.0)
+        self.report(self.lights[0], {})
+
+        self.assertEqual(
+            self.get_group_publishes(), [{"state": "ON", "brightness": 254}]
+        )
+        self.assertEqual(self.get_device_publish_count(), 0)
+        self.assertTrue(all(light.brightness.get() == 254 for light in self.lights))
+
+    def test_unchanged_group_write_is_suppressed(self) -> None:
+        self.group.set("brightness", 60)
+        self.report(self.lights[0], {})
+        self.published.clear()
+
+        self.group.set("brightness", 60)
+        self.report(self.lights[0], {})
+
+        self.assertEqual(self.published, [])
+        self.assertEqual(self.group.suppressed, 1)
+
+    def test_outliers_never_receive_the_group_value(self) -> None:
+        # Like turn_on_morning_lights in automation.py
+        self.group.set("state", 1)
+        self.group.set_values_normalized(
+            "brightness",
+            {light: 0.5 if i < 2 else 1.0 for i, light in enumerate(self.lights)},
+        )
+        self.report(self.lights[0], {})
+
+        self.assertEqual(self.get_group_publishes(), [{"state": "ON"}])
+        self.assertEqual(self.get_publishes(self.lights[0]), [{"brightness": 127}])
+        self.assertEqual(self.get_publishes(self.lights[1]), [{"brightness": 127}])
+        self.assertEqual(self.get_publishes(self.lights[2]), [{"brightness": 254}])
+
+        # The members turn on at their own brightness
+        last_device_publish = max(
+            i
+            for i, (topic, _) in enumerate(self.published)
+            if topic != f"{BASE_TOPIC}/test_lights/set"
+        )
+        group_publish = self.published.index(
+            (f"{BASE_TOPIC}/test_lights/set", {"state": "ON"})
+        )
+        self.assertGreater(group_publish, last_device_publish)
+
+    def test_drifted_membership_falls_back_to_device_writes(self) -> None:
+        self.report_bridge_group([light._get_topic() for light in self.lights[1:]])
+        self.assertFalse(self.group.is_in_sync())
+
+        with self.assertLogs("zigbee_groups", "WARNING"):
+            self.report_bridge_group(["Some other light"])
+
+        self.group.set("state", 1)
+        self.report(self.lights[0], {})
+
+        self.assertEqual(self.get_group_publishes(), [])
+        self.assertEqual(self.get_device_publish_count(), len(self.lights))
+
+
+if __name__ == "__main__":
+    unittest.main()
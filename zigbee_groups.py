@@ -0,0 +1,332 @@
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+from pyziggy.devices_client import Device, DevicesClient
+from pyziggy.message_loop import message_loop
+from pyziggy.mqtt_client import MqttClientPublisher, MqttSubscriber
+from pyziggy.parameters import SettableNumericParameter
+
+logger = logging.getLogger(__name__)
+
+
+class _PyziggyInternals:
+    """
+    The only place in this module that uses non-public parts of pyziggy, written
+    against pyziggy 0.9.3. pyziggy has no public API for subscribing to topics other
+    than those of the devices, or for updating parameters after a message that the
+    devices didn't send themselves, as happens with group messages. Keeping these
+    uses together makes them easy to review when updating pyziggy.
+    """
+
+    @staticmethod
+    def connect(
+        devices: DevicesClient, subscriber: MqttSubscriber, subscribe: bool
+    ) -> None:
+        """
+        Lets ``subscriber`` publish to its topic below the base topic of
+        ``devices``, and if ``subscribe`` is True, dispatches messages on that topic
+        to it.
+        """
+        topic = f"{devices._base_topic}/{subscriber._get_topic()}"
+        subscriber._on_connect(MqttClientPublisher(devices, topic))
+
+        if subscribe:
+            devices._dispatch[topic] = subscriber
+            devices._impl.subscribe(topic)
+
+    @staticmethod
+    def get_range(param: SettableNumericParameter) -> Tuple[float, float]:
+        # get_maximum() returns the minimum in pyziggy 0.9.3
+        return param._min_value, param._max_value
+
+    @staticmethod
+    def get_friendly_name(device: Device) -> str:
+        return device._get_topic()
+
+    @staticmethod
+    def get_mqtt_value(param: SettableNumericParameter, value: float) -> Any:
+        return param._transform_internal_to_mqtt_value(_clamp(param, value))
+
+    @staticmethod
+    def is_up_to_date(param: SettableNumericParameter, value: float) -> bool:
+        """
+        :return: True if ``set(value)`` wouldn't send anything.
+        """
+        return not param._stale and param.get() == _clamp(param, value)
+
+    @staticmethod
+    def apply_group_write(param: SettableNumericParameter, value: float) -> None:
+        """
+        Updates the parameter as if its device reported ``value``, and cancels any
+        per-device write of it that hasn't been sent yet.
+        """
+        param._should_send_to_device = False
+        param._stale = False
+        param._requested_value = _clamp(param, value)
+        param._set_reported_value(
+            param._transform_internal_to_mqtt_value(param._requested_value)
+        )
+
+
+def _clamp(param: SettableNumericParameter, value: float) -> float:
+    minimum, maximum = _PyziggyInternals.get_range(param)
+    return min(maximum, max(minimum, value))
+
+
+class ZigbeeGroup(MqttSubscriber):
+    """
+    Sends parameter writes that are the same for all members of a device collection
+    as a single zigbee2mqtt group message, instead of one message per device. Writes
+    with different values for some members are sent as per-device messages, since a
+    group message reaches all members.
+
+    The group has to exist in zigbee2mqtt with exactly the same members. Until
+    zigbee2mqtt confirms this, or if the membership drifts, all writes fall back to
+    per-device messages.
+
+    Create instances using :meth:`ZigbeeGroups.add`.
+    """
+
+    def __init__(self, name: str, members: Sequence[Any]):
+        super().__init__(name)
+        self._members: List[Device] = []
+
+        for member in members:
+            assert isinstance(member, Device)
+            self._members.append(member)
+
+        self._in_sync = False
+        self._sync_checked = False
+        self._last_group_members: List[str] | None = None
+        self._pending: Dict[str, Any] = {}
+
+        self.group_messages = 0
+        self.device_writes = 0
+        self.suppressed = 0
+
+    def get_name(self) -> str:
+        return self._get_topic()
+
+    def is_in_sync(self) -> bool:
+        """
+        :return: True if zigbee2mqtt reported a group with the same members.
+        """
+        return self._in_sync
+
+    def set(self, property: str, value: float) -> None:
+        """
+        Sets the parameter called ``property`` to the same value on all members.
+        """
+        self.set_values(property, {member: value for member in self._members})
+
+    def set_normalized(self, property: str, value: float) -> None:
+        """
+        Equivalent of calling ``set_normalized(value)`` on the parameter called
+        ``property`` of all members.
+        """
+        self.set_values_normalized(
+            property, {member: value for member in self._members}
+        )
+
+    def set_values_normalized(self, property: str, values: Dict[Any, float]) -> None:
+        raw_values: Dict[Any, float] = {}
+
+        for member, value in values.items():
+            param = getattr(member, property)
+            minimum, maximum = _PyziggyInternals.get_range(param)
+            raw_values[member] = float(round(value * (maximum - minimum) + minimum))
+
+        self.set_values(property, raw_values)
+
+    def set_values(self, property: str, values: Dict[Any, float]) -> None:
+        """
+        Sets the parameter called ``property`` on each member to its value in
+        ``values``.
+
+        If the group can be used and all values are the same, they are sent as a
+        group message. Otherwise each member receives a per-device message.
+
+        Group messages are published after the per-device messages written in the
+        same message loop callback. This way members that e.g. receive a different
+        brightness while the group is turned on, turn on at that brightness, instead
+        of flashing at their previous one.
+        """
+        params: Dict[Device, SettableNumericParameter] = {}
+
+        for member in values:
+            param = getattr(member, property)
+            assert isinstance(param, SettableNumericParameter)
+            params[member] = param
+
+        group_value = self._get_group_value(values)
+
+        if group_value is None:
+            for member, value in values.items():
+                params[member].set(value)
+                self.device_writes += 1
+
+            return
+
+        if all(
+            _PyziggyInternals.is_up_to_date(param, group_value)
+            for param in params.values()
+        ):
+            self.suppressed += 1
+        else:
+            self._write_to_group(list(params.values()), group_value)
+
+    def _get_group_value(self, values: Dict[Any, float]) -> float | None:
+        if not self._in_sync or not self.is_connected():
+            return None
+
+        if set(values.keys()) != set(self._members) or len(self._members) < 2:
+            return None
+
+        unique_values = set(values.values())
+
+        return unique_values.pop() if len(unique_values) == 1 else None
+
+    def _write_to_group(
+        self, params: List[SettableNumericParameter], value: float
+    ) -> None:
+        param = params[0]
+        self._pending[param.get_property_name()] = _PyziggyInternals.get_mqtt_value(
+            param, value
+        )
+
+        # The group message takes precedence over earlier per-device writes made in
+        # the same message loop callback. The parameters are updated the same way
+        # as if the devices reported the new value.
+        for param in params:
+            _PyziggyInternals.apply_group_write(param, value)
+
+        if len(self._pending) == 1:
+            message_loop.post_message(self._post_flush)
+
+    def _post_flush(self) -> None:
+        # Per-device messages are posted as the parameters are set, so by now those
+        # of the callback that wrote to the group are ahead in the queue
+        message_loop.post_message(self._flush)
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+
+        self.publish(self._pending)
+        self._pending = {}
+        self.group_messages += 1
+
+    def _update_sync_state(self, group_members: List[str] | None) -> None:
+        expected = sorted(
+            _PyziggyInternals.get_friendly_name(member) for member in self._members
+        )
+        in_sync = group_members is not None and sorted(group_members) == expected
+
+        members_changed = (
+            not self._sync_checked or group_members != self._last_group_members
+        )
+
+        if not in_sync and members_changed:
+            if group_members is None:
+                logger.warning(
+                    f'zigbee2mqtt has no group called "{self.get_name()}". Using'
+                    " per-device messages instead."
+                )
+            else:
+                logger.warning(
+                    f'The members of the zigbee2mqtt group "{self.get_name()}" have'
+                    f" drifted. Missing: {sorted(set(expected) - set(group_members))},"
+                    f" unexpected: {sorted(set(group_members) - set(expected))}."
+                    " Using per-device messages instead."
+                )
+
+        self._in_sync = in_sync
+        self._sync_checked = True
+        self._last_group_members = group_members
+
+
+class _BridgeTopicSubscriber(MqttSubscriber):
+    def __init__(self, topic: str, callback):
+        super().__init__(topic)
+        self._callback = callback
+
+    def _on_message(self, payload: Any) -> None:
+        self._callback(payload)
+
+
+class ZigbeeGroups:
+    """
+    Maps Python collections of devices to zigbee2mqtt groups. The group memberships
+    are checked against the ``bridge/groups`` messages of zigbee2mqtt.
+
+    Example::
+
+        zigbee_groups = ZigbeeGroups(devices)
+        office_group = zigbee_groups.add("office", office)
+        office_group.set("state", 1)
+    """
+
+    def __init__(self, devices: DevicesClient):
+        self._devices = devices
+        self._groups: List[ZigbeeGroup] = []
+        self._device_names: Dict[str, str] = {}
+        self._bridge_groups: List[Dict[str, Any]] | None = None
+        self._subscribers = [
+            _BridgeTopicSubscriber("bridge/devices", self._on_bridge_devices),
+            _BridgeTopicSubscriber("bridge/groups", self._on_bridge_groups),
+        ]
+
+        devices.on_connect.add_listener(self._on_connect)
+
+    def add(self, name: str, members: Sequence[Any]) -> ZigbeeGroup:
+        group = ZigbeeGroup(name, members)
+        self._groups.append(group)
+        return group
+
+    def _on_connect(self) -> None:
+        for group in self._groups:
+            _PyziggyInternals.connect(self._devices, group, subscribe=False)
+
+        for subscriber in self._subscribers:
+            _PyziggyInternals.connect(self._devices, subscriber, subscribe=True)
+
+    def _on_bridge_devices(self, payload: Any) -> None:
+        if not isinstance(payload, list):
+            return
+
+        self._device_names = {
+            device["ieee_address"]: device["friendly_name"]
+            for device in payload
+            if "ieee_address" in device and "friendly_name" in device
+        }
+        self._check_groups()
+
+    def _on_bridge_groups(self, payload: Any) -> None:
+        if not isinstance(payload, list):
+            return
+
+        self._bridge_groups = payload
+        self._check_groups()
+
+    def _check_groups(self) -> None:
+        if not self._device_names or self._bridge_groups is None:
+            return
+
+        bridge_groups = {
+            bridge_group.get("friendly_name"): bridge_group
+            for bridge_group in self._bridge_groups
+        }
+
+        for group in self._groups:
+            if group.get_name() not in bridge_groups:
+                group._update_sync_state(None)
+                continue
+
+            group._update_sync_state(
+                [
+                    self._device_names.get(
+                        member["ieee_address"], member["ieee_address"]
+                    )
+                    for member in bridge_groups[group.get_name()].get("members", [])
+                ]
+            )